@@ -0,0 +1,232 @@
+"""Benchmark the champ select handlers on generated event streams (see replay.py).
+
+Run `python bench.py` for all scenarios, or name some: `python bench.py draft bursts`.
+"""
+import argparse
+import asyncio
+import time
+
+import main
+from replay import FakeConnection, SESSION_URI, action_latencies, prepare, replay, summarize
+
+READY_CHECK_URI = '/lol-matchmaking/v1/ready-check'
+GAMEFLOW_URI = '/lol-gameflow/v1/gameflow-phase'
+POSITIONS = ['top', 'jungle', 'middle', 'bottom', 'utility']
+LOCAL_CELL = 2
+
+
+def champion_ids():
+    """Twenty distinct champion IDs (ten bans, ten picks), none of them in our config"""
+    configured = {candidate[0] for candidate in main.active_config.bans}
+    for candidates in main.active_config.roles.values():
+        configured.update(candidate[0] for candidate in candidates)
+    return [champion_id for champion_id in range(900, 1000) if champion_id not in configured][:20]
+
+
+class SessionBuilder:
+    """Builds successive /lol-champ-select/v1/session snapshots for one lobby"""
+
+    def __init__(self, game_id, with_bans):
+        self.game_id = game_id
+        self.phase = 'PLANNING'
+        self.my_team = [{'cellId': cell, 'assignedPosition': POSITIONS[cell], 'championId': 0,
+                         'championPickIntent': 0} for cell in range(5)]
+        self.their_team = [{'cellId': cell, 'assignedPosition': '', 'championId': 0,
+                            'championPickIntent': 0} for cell in range(5, 10)]
+        self.actions = []
+        if with_bans:
+            self.actions.append([self.action(cell, cell, 'ban') for cell in range(10)])
+        # Draft pick order: 1-2-2-2-2-1 alternating between teams
+        pick_order = [[0], [5, 6], [1, 2], [7, 8], [3, 4], [9]]
+        next_id = 10
+        for turn in pick_order:
+            self.actions.append([self.action(next_id + i, cell, 'pick') for i, cell in enumerate(turn)])
+            next_id += len(turn)
+
+    @staticmethod
+    def action(action_id, cell, action_type):
+        return {'id': action_id, 'actorCellId': cell, 'type': action_type, 'championId': 0,
+                'completed': False, 'isInProgress': False, 'isAllyAction': cell < 5}
+
+    def snapshot(self):
+        return {
+            'gameId': self.game_id,
+            'localPlayerCellId': LOCAL_CELL,
+            'timer': {'phase': self.phase},
+            'myTeam': [dict(player) for player in self.my_team],
+            'theirTeam': [dict(player) for player in self.their_team],
+            'actions': [[dict(action) for action in action_list] for action_list in self.actions]
+        }
+
+    def start_turn(self, turn):
+        for action in self.actions[turn]:
+            action['isInProgress'] = True
+
+    def complete_turn(self, turn, champions):
+        for action in self.actions[turn]:
+            action['isInProgress'] = False
+            action['completed'] = True
+            # The stream is fixed, so our own action just gets the next ID too
+            action['championId'] = champions.pop()
+            if action['type'] == 'pick':
+                players = self.my_team if action['actorCellId'] < 5 else self.their_team
+                players[action['actorCellId'] % 5]['championId'] = action['championId']
+
+
+class Timeline:
+    """Event list with a running clock, in the (t, uri, type, data) form replay() takes"""
+
+    def __init__(self):
+        self.t = 0.0
+        self.events = []
+
+    def add(self, uri, data, event_type='UPDATE', after=0.05):
+        self.t += after
+        self.events.append((self.t, uri, event_type, data))
+
+    def session(self, builder, updates=1, after=0.05):
+        for i in range(updates):
+            self.add(SESSION_URI, builder.snapshot(), 'CREATE' if not self.events else 'UPDATE',
+                     after if i == 0 else 0.001)
+
+    def queue_pop(self):
+        self.add(GAMEFLOW_URI, 'ReadyCheck')
+        self.add(READY_CHECK_URI, {'state': 'InProgress', 'playerResponse': 'None'})
+        self.add(GAMEFLOW_URI, 'ChampSelect', after=1.0)
+
+
+def draft_lobby(timeline, game_id, with_bans, updates):
+    """A full draft (or blind, without bans) champ select from planning to finalization"""
+    champions = champion_ids()
+    builder = SessionBuilder(game_id, with_bans)
+    timeline.session(builder, updates)
+    builder.phase = 'BAN_PICK'
+    turns = range(len(builder.actions))
+    for turn in turns:
+        builder.start_turn(turn)
+        timeline.session(builder, updates, after=0.5)
+        builder.complete_turn(turn, champions)
+        timeline.session(builder, updates, after=2.0)
+    builder.phase = 'FINALIZATION'
+    timeline.session(builder, updates)
+    timeline.add(GAMEFLOW_URI, 'GameStart', after=5.0)
+    timeline.add(GAMEFLOW_URI, 'InProgress')
+
+
+def blind_pick():
+    """Blind pick: no bans, every player picks at the same time"""
+    timeline = Timeline()
+    timeline.queue_pop()
+    builder = SessionBuilder(1, with_bans=False)
+    builder.actions = [[SessionBuilder.action(10 + cell, cell, 'pick') for cell in range(10)]]
+    builder.phase = 'BAN_PICK'
+    timeline.session(builder)
+    builder.start_turn(0)
+    timeline.session(builder, after=0.5)
+    builder.complete_turn(0, champion_ids())
+    builder.phase = 'FINALIZATION'
+    timeline.session(builder, after=2.0)
+    timeline.add(GAMEFLOW_URI, 'InProgress', after=5.0)
+    return timeline.events
+
+
+def draft_with_bans():
+    """Ranked-style draft: planning, simultaneous bans, 1-2-2-2-2-1 picks"""
+    timeline = Timeline()
+    timeline.queue_pop()
+    draft_lobby(timeline, 1, with_bans=True, updates=1)
+    return timeline.events
+
+
+def dodged_lobby():
+    """A lobby dodged during planning, then a new queue pop and a full draft"""
+    timeline = Timeline()
+    timeline.queue_pop()
+    builder = SessionBuilder(1, with_bans=True)
+    timeline.session(builder, updates=3)
+    timeline.add(SESSION_URI, builder.snapshot(), 'DELETE', after=3.0)
+    timeline.add(GAMEFLOW_URI, 'Lobby')
+    timeline.queue_pop()
+    draft_lobby(timeline, 2, with_bans=True, updates=1)
+    return timeline.events
+
+
+def update_bursts():
+    """A draft where every state is followed by a burst of identical UPDATE events (timer ticks)"""
+    timeline = Timeline()
+    timeline.queue_pop()
+    draft_lobby(timeline, 1, with_bans=True, updates=50)
+    return timeline.events
+
+
+SCENARIOS = {
+    'blind': blind_pick,
+    'draft': draft_with_bans,
+    'dodge': dodged_lobby,
+    'bursts': update_bursts
+}
+
+
+def ensure_champions():
+    """Without cached or downloaded static data, give the configured champions stand-in IDs"""
+    if main.champions:
+        return
+    names = list(main.config['bans'])
+    for role_config in main.config['champions'].values():
+        names.extend(main.parse_pick_entry(entry)['champion'] for entry in role_config.get('order', []))
+    main.set_champions([{'id': champion_id, 'alias': name, 'name': name}
+                        for champion_id, name in enumerate(dict.fromkeys(names), 1)])
+    main.build_static_indexes()
+    print("No static data available, using stand-in champion IDs")
+
+
+async def replay_scenario(name, iterations, latency, speed):
+    """Replay a scenario several times; returns (events, seconds, event-to-PATCH latencies)"""
+    event_count = 0
+    elapsed = 0.0
+    latencies = []
+    for _ in range(iterations):
+        connection = FakeConnection(latency=latency)
+        await prepare(connection, load_static_data=False)
+        events = SCENARIOS[name]()
+        start = time.perf_counter()
+        dispatched = await replay(events, connection, speed=speed)
+        elapsed += time.perf_counter() - start
+        event_count += len(events)
+        latencies.extend(action_latencies(dispatched, connection.calls))
+    return event_count, elapsed, latencies
+
+
+async def run_scenario(name, iterations, latency, speed):
+    """Report throughput with no pauses between events, and latency with the timeline sped up.
+
+    Without pauses nearly the whole stream is coalesced into its final snapshot,
+    so our in-progress actions are only seen (and timed) in the paced run.
+    """
+    event_count, elapsed, _ = await replay_scenario(name, iterations, latency, speed=0)
+    _, _, latencies = await replay_scenario(name, iterations, latency, speed=speed)
+    summarize(name, event_count, elapsed, latencies)
+
+
+async def run(names, iterations, latency, speed):
+    await main.load_static_data()
+    await main.close_http_session()
+    ensure_champions()
+    for name in names:
+        await run_scenario(name, iterations, latency, speed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the champ select handlers')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--iterations', type=int, default=20, help='runs per scenario')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='simulated LCU latency per request in seconds')
+    parser.add_argument('--speed', type=float, default=100.0,
+                        help='timeline speed-up for the latency run')
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    asyncio.run(run(args.scenarios or list(SCENARIOS), args.iterations, args.latency, args.speed))
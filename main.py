@@ -1,40 +1,115 @@
-import asyncio
 import time
-import requests
-import urllib3
-import traceback
+# When this module started importing, for the profiling mode's startup breakdown
+_import_started = time.perf_counter()
+import asyncio
+import argparse
+import atexit
+import bisect
+import functools
+import heapq
+import io
+import itertools
+import signal
+import aiohttp
 import json
+import logging
+import logging.handlers
+import os
+import multiprocessing
+import queue
 import re
-from lcu_driver import Connector
+import psutil
+from collections import OrderedDict
+from lcu_driver import Connector, MultipleClientConnector
+from lcu_driver import connection as lcu_connection
+from lcu_driver.connection import Connection
+from lcu_driver.utils import _return_ux_process
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+_imports_done = time.perf_counter()
 
 connector = Connector()
-global am_i_assigned, am_i_picking, am_i_banning, ban_number, phase, picks, bans, in_game, have_i_prepicked
-am_i_assigned = False
-am_i_banning = False
-am_i_picking = False
-in_game = False
-phase = ''
-have_i_prepicked = False
+log = logging.getLogger('autopick')
+
+CONFIG_FILE = "config.json"
+# How often (seconds) config.json is checked for changes
+CONFIG_WATCH_INTERVAL = 2
+
+def read_config():
+    """Read config.json and check that it has champions and bans of the right shape"""
+    with open(CONFIG_FILE, "r") as f:
+        raw_config = json.load(f)
+    if not isinstance(raw_config, dict) or not raw_config.get("champions") or not raw_config.get("bans"):
+        raise ValueError("Champions or bans configuration is missing in config.json")
+    if not isinstance(raw_config["bans"], list):
+        raise ValueError("bans in config.json must be a list")
+    if not isinstance(raw_config["champions"], dict):
+        raise ValueError("champions in config.json must be an object of roles")
+    for role, role_config in raw_config["champions"].items():
+        if not isinstance(role_config, dict) or not isinstance(role_config.get("order", []), list):
+            raise ValueError(f"champions.{role} in config.json must be an object with an order list")
+    return raw_config
+
+def log_config_summary(raw_config):
+    for role, role_config in raw_config["champions"].items():
+        log.info("%s: %d picks", role, len(role_config.get("order", [])))
+    log.info("Bans: %d", len(raw_config['bans']))
 
 # Load config from config.json
 try:
-    with open("config.json", "r") as f:
-        config = json.load(f)
-    champions_config = config.get("champions", {})
-    bans = config.get("bans", [])
-    # Print configuration summary
-    for role, config in champions_config.items():
-        pick_count = len(config.get("order", []))
-        print(f"{role}: {pick_count} picks")
-    print(f"Bans: {len(bans)}")
-    if not champions_config or not bans:
-        raise ValueError("Champions or bans configuration is missing in config.json")
+    config = read_config()
+    _config_mtime = os.stat(CONFIG_FILE).st_mtime_ns
+    # Latency metrics export; "file" ending in .json exports JSON, otherwise Prometheus text
+    metrics_config = config.get("metrics", {})
+    METRICS_FILE = metrics_config.get("file", "metrics.prom")
+    METRICS_EXPORT_INTERVAL = metrics_config.get("interval", 60)
+    # Log output: the console plus a rotating JSON lines file ("file": null = console only)
+    logging_config = config.get("logging", {})
+    LOG_LEVEL = logging_config.get("level", "INFO")
+    LOG_FILE = logging_config.get("file", "autopick.log.jsonl")
+    LOG_MAX_BYTES = logging_config.get("max_bytes", 5 * 1024 * 1024)
+    LOG_BACKUP_COUNT = logging_config.get("backups", 3)
 except Exception as e:
-    print(f"Error loading config.json: {str(e)}")
-    print("Please ensure config.json exists with valid champions and bans configuration")
+    log.error("Error loading config.json: %s", e)
+    log.error("Please ensure config.json exists with valid champions and bans configuration")
     exit(1)
+_config_loaded = time.perf_counter()
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record, with any fields passed as extra={'fields': {...}}"""
+
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['error'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted; the writer thread does all formatting and I/O"""
+
+    def prepare(self, record):
+        return record
+
+def start_logging(level=None, log_file=LOG_FILE):
+    """Send log records through a queue to a background thread writing the console and log file"""
+    # A forked worker inherits the parent's queue, whose writer thread isn't running in it
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    handlers = [logging.StreamHandler()]
+    handlers[0].setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S'))
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        file_handler.setFormatter(JsonLogFormatter())
+        handlers.append(file_handler)
+    listener = logging.handlers.QueueListener(queue.SimpleQueue(), *handlers)
+    log.addHandler(LogQueueHandler(listener.queue))
+    log.setLevel((level or LOG_LEVEL).upper())
+    # Records below the level are dropped before their message is ever formatted
+    log.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
 
 # Summoner spell mappings
 SUMMONER_SPELLS = {
@@ -45,6 +120,14 @@ SUMMONER_SPELLS = {
 # Rune data - will be loaded from Data Dragon
 runes_data = None
 
+# Normalized rune name -> matching runes, rebuilt whenever rune data loads
+rune_index = {}
+rune_index_keys = []
+
+# Config compiled against the loaded static data (None until static data loads).
+# Shared by all clients; each champ select keeps the one active when it started.
+active_config = None
+
 # Stat rune mappings - organized by slot (will be updated from Community Dragon API)
 STAT_RUNES = {
     # Offense Slot (Row 1)
@@ -68,49 +151,121 @@ STAT_RUNES = {
     'armor mr': 5012         # +1-8 Armor and Magic Resist (removed from current system)
 }
 
-pick_number = 0
-ban_number = 0
-assigned_position = ''
-
-# Global lazy-loaded Data Dragon version
+# Data Dragon version of the installed static data
 _ddragon_version = None
 
-def get_ddragon_version():
-    """Get Data Dragon version (lazy loaded)"""
-    global _ddragon_version
-    if _ddragon_version is None:
-        _ddragon_version = requests.get('https://ddragon.leagueoflegends.com/api/versions.json').json()[0]
-    return _ddragon_version
-
-async def get_champions_map():
-    # Get champion data from Data Dragon for English names
-    ddragon_version = get_ddragon_version()
-    ddragon_champions = requests.get(f'https://ddragon.leagueoflegends.com/cdn/{ddragon_version}/data/en_US/champion.json').json()
-    # Swap key and value to map from name to ID instead
-    champion_name_to_key = {name: int(champ['key']) for name, champ in ddragon_champions['data'].items()}
-    
-    champions_map = champion_name_to_key
-            
-    return champions_map
+# Champions from Data Dragon as {'id', 'alias', 'name'} (numeric key, internal ID, display name)
+champions = []
+# Normalized display name / internal ID / numeric key -> champion IDs, its sorted
+# keys for prefix lookups, and champion ID -> display name
+champion_index = {}
+champion_index_keys = []
+champion_names = {}
+
+DDRAGON_VERSIONS_URL = 'https://ddragon.leagueoflegends.com/api/versions.json'
+
+# On-disk cache of the reduced static data, keyed by Data Dragon version
+STATIC_DATA_CACHE_FILE = 'static_data_cache.json'
+STATIC_DATA_CACHE_SCHEMA = 2
+
+# Per-source timeouts (seconds) for static data downloads
+STATIC_DATA_TIMEOUTS = {
+    'versions': 5,
+    'champions': 10,
+    'runes': 10,
+    'perks': 15
+}
 
-async def get_runes_data():
+# Set once champion and rune data can be used by the champ select handler
+static_data_ready = asyncio.Event()
+
+# The installed static data as a cache entry (None until a complete set is
+# installed); kept for the life of the process, so reconnects reuse it
+static_data = None
+# How often (seconds) Data Dragon is checked for a new patch, and how often a
+# downloaded patch waits for running champ selects to end before it is swapped in
+STATIC_DATA_CHECK_INTERVAL = 30 * 60
+STATIC_DATA_SWAP_POLL_INTERVAL = 2
+# Set to run a version check now instead of at the next interval
+static_data_check_requested = asyncio.Event()
+
+# Pooled HTTP client shared by all static data downloads
+_http_session = None
+
+def get_http_session():
+    """Get the shared HTTP client session, creating it on first use"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8))
+    return _http_session
+
+async def close_http_session():
+    """Close the shared HTTP client session if it is open"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+async def fetch_json(url, source):
+    """GET a JSON document using the timeout configured for its source"""
+    timeout = aiohttp.ClientTimeout(total=STATIC_DATA_TIMEOUTS[source])
+    async with get_http_session().get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        # Community Dragon serves JSON as text/plain
+        return await response.json(content_type=None)
+
+async def fetch_ddragon_version(etag=None):
+    """Fetch the latest Data Dragon version, revalidating with a conditional request.
+
+    Returns (version, etag); version is None when the server answers 304 Not Modified.
+    """
+    headers = {'If-None-Match': etag} if etag else {}
+    timeout = aiohttp.ClientTimeout(total=STATIC_DATA_TIMEOUTS['versions'])
+    async with get_http_session().get(DDRAGON_VERSIONS_URL, headers=headers, timeout=timeout) as response:
+        if response.status == 304:
+            return None, etag
+        response.raise_for_status()
+        return (await response.json(content_type=None))[0], response.headers.get('ETag')
+
+async def get_champions(ddragon_version):
+    """Load the champion list (numeric key, internal ID, display name) from Data Dragon"""
+    try:
+        # Get champion data from Data Dragon for English names
+        ddragon_champions = await fetch_json(f'https://ddragon.leagueoflegends.com/cdn/{ddragon_version}/data/en_US/champion.json', 'champions')
+        return [{'id': int(champ['key']), 'alias': alias, 'name': champ['name']}
+                for alias, champ in ddragon_champions['data'].items()]
+    except Exception as e:
+        log.warning("Failed to load champion data: %s", e)
+        return None
+
+def reduce_runes_data(raw_runes):
+    """Keep only the rune tree fields used for rune lookups"""
+    return [
+        {
+            'id': tree['id'],
+            'name': tree['name'],
+            'slots': [{'runes': [{'id': rune['id'], 'name': rune['name']} for rune in slot['runes']]}
+                      for slot in tree['slots']]
+        }
+        for tree in raw_runes
+    ]
+
+async def get_runes_data(ddragon_version):
     """Load rune data from Data Dragon"""
-    global runes_data
     try:
-        ddragon_version = get_ddragon_version()
-        runes_response = requests.get(f'https://ddragon.leagueoflegends.com/cdn/{ddragon_version}/data/en_US/runesReforged.json')
-        runes_data = runes_response.json()
-        return runes_data
+        raw_runes = await fetch_json(f'https://ddragon.leagueoflegends.com/cdn/{ddragon_version}/data/en_US/runesReforged.json', 'runes')
+        return reduce_runes_data(raw_runes)
     except Exception as e:
-        print(f"Failed to load runes data: {str(e)}")
+        log.warning("Failed to load runes data: %s", e)
         return None
 
 async def load_stat_runes():
-    """Load current stat rune data from Community Dragon API with accurate slot mappings"""
-    global STAT_RUNES
+    """Load current stat rune data from Community Dragon API with accurate slot mappings
+
+    Returns the loaded stat rune map, or None when the API could not be used.
+    """
     try:
-        response = requests.get('https://raw.communitydragon.org/latest/plugins/rcp-be-lol-game-data/global/default/v1/perks.json')
-        perks_data = response.json()
+        perks_data = await fetch_json('https://raw.communitydragon.org/latest/plugins/rcp-be-lol-game-data/global/default/v1/perks.json', 'perks')
         
         # Extract stat runes (IDs 5001-5013) with proper slot categorization
         stat_runes = {}
@@ -150,42 +305,272 @@ async def load_stat_runes():
                     stat_runes['resist scaling'] = perk_id
         
         if stat_runes:
-            STAT_RUNES.update(stat_runes)
-            print(f"Updated stat runes from Community Dragon API: {len(stat_runes)} stat runes loaded")
-            print(f"Current stat rune layout: Offense (5008/5005/5007), Flex (5008/5010/5001), Defense (5011/5013/5001)")
+            log.info("Loaded stat runes from Community Dragon API: %d stat runes loaded", len(stat_runes))
+            log.debug("Current stat rune layout: Offense (5008/5005/5007), Flex (5008/5010/5001), Defense (5011/5013/5001)")
+            return stat_runes
         
     except Exception as e:
-        print(f"Failed to load stat runes from Community Dragon API: {str(e)}")
-        print("Using fallback stat rune values")
+        log.warning("Failed to load stat runes from Community Dragon API: %s", e)
+        log.warning("Using fallback stat rune values")
+    return None
+
+def load_static_data_cache():
+    """Load the on-disk static data cache, or None if it is missing or unusable"""
+    try:
+        with open(STATIC_DATA_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('schema') != STATIC_DATA_CACHE_SCHEMA:
+        return None
+    return cache
+
+def save_static_data_cache(cache):
+    """Write the static data cache to disk, replacing the old file atomically"""
+    # Worker processes may save at the same time; each writes its own temp file
+    temp_file = f"{STATIC_DATA_CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(temp_file, STATIC_DATA_CACHE_FILE)
+    except OSError as e:
+        log.warning("Failed to write static data cache: %s", e)
+
+def static_data_complete(data):
+    """Whether every static data source made it into a cache entry"""
+    return all(data[key] is not None for key in ('champions', 'runes_data', 'stat_runes'))
+
+def install_static_data(data):
+    """Swap in cached or downloaded static data and recompile the config against it.
+
+    Nothing here yields to the event loop, so handlers see either the old data
+    or the new, never a mix. Sources missing from data keep their current values.
+    """
+    global static_data, runes_data, _ddragon_version
+    if data['champions'] is not None:
+        set_champions(data['champions'], data.get('champion_index'))
+    if data['runes_data'] is not None:
+        runes_data = data['runes_data']
+    if data['stat_runes'] is not None:
+        STAT_RUNES.update(data['stat_runes'])
+    build_static_indexes()
+    if static_data_complete(data):
+        static_data = data
+        _ddragon_version = data['version']
+
+async def download_static_data(version, etag):
+    """Download a version's champions, runes and stat runes concurrently into a cache entry.
+
+    Sources that failed are None in the entry.
+    """
+    new_champions, new_runes_data, stat_runes = await asyncio.gather(
+        timed_phase(f"static data {version}: champions", get_champions(version)),
+        timed_phase(f"static data {version}: runes", get_runes_data(version)),
+        timed_phase(f"static data {version}: stat runes", load_stat_runes()))
+    return {
+        'schema': STATIC_DATA_CACHE_SCHEMA,
+        'version': version,
+        'versions_etag': etag,
+        'champions': new_champions,
+        'champion_index': build_champion_index(new_champions) if new_champions else None,
+        'runes_data': new_runes_data,
+        'stat_runes': dict(STAT_RUNES, **stat_runes) if stat_runes else None,
+    }
+
+def champ_select_running():
+    """Whether any served client is in champ select"""
+    return any(client.gameflow_phase == 'ChampSelect' for client in clients.values())
+
+async def update_static_data(between_games=False):
+    """Revalidate the installed static data against Data Dragon, installing a new version if there is one.
+
+    With between_games, a new version is downloaded in the background and only
+    swapped in once no client is in champ select.
+    """
+    current = static_data
+    version, etag = await fetch_ddragon_version(current.get('versions_etag') if current else None)
+    if current and version in (None, current['version']):
+        if etag != current.get('versions_etag'):
+            current['versions_etag'] = etag
+            save_static_data_cache(current)
+        log.log(logging.DEBUG if between_games else logging.INFO,
+                "Static data is up to date (%s)", current['version'])
+        return
+
+    # New version (or nothing installed yet): download everything for it concurrently
+    log.info("Downloading static data for version %s", version)
+    data = await download_static_data(version, etag)
+    complete = static_data_complete(data)
+    if between_games:
+        if not complete:
+            log.warning("Static data for version %s incomplete, keeping %s", version, _ddragon_version)
+            return
+        while champ_select_running():
+            await asyncio.sleep(STATIC_DATA_SWAP_POLL_INTERVAL)
+    install_static_data(data)
+    if not complete:
+        log.warning("Static data incomplete, not updating the cache")
+        return
+    save_static_data_cache(data)
+    log.info("Installed and cached static data for version %s", version)
+
+async def load_static_data():
+    """Load static data, starting from the on-disk cache and revalidating it against Data Dragon"""
+    try:
+        await _load_static_data()
+    finally:
+        # Never leave the champ select handler waiting, even if the download failed
+        static_data_ready.set()
+
+async def _load_static_data():
+    started = time.perf_counter()
+    cache = load_static_data_cache()
+    if cache:
+        install_static_data(cache)
+        static_data_ready.set()
+        log.info("Loaded cached static data for version %s", cache['version'])
+    record_phase("static data: cache", started)
+
+    try:
+        await timed_phase("static data: revalidate", update_static_data())
+    except Exception as e:
+        if cache:
+            log.warning("Could not check Data Dragon version, using cached data: %s", e)
+        else:
+            log.error("Could not check Data Dragon version and no cached data is available: %s", e)
+
+async def watch_static_data():
+    """Check for a new patch periodically and whenever a check is requested (e.g. on reconnect)"""
+    while True:
+        try:
+            await asyncio.wait_for(static_data_check_requested.wait(), STATIC_DATA_CHECK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        static_data_check_requested.clear()
+        try:
+            await update_static_data(between_games=True)
+        except Exception as e:
+            log.warning("Could not check Data Dragon for a new version: %s", e)
+
+_static_data_watch_task = None
+
+def start_static_data_watcher():
+    """Start the patch checker once per process"""
+    global _static_data_watch_task
+    if _static_data_watch_task is None:
+        _static_data_watch_task = asyncio.create_task(watch_static_data())
 
 def normalize_string(s):
     """Remove spaces, separators, and convert to lowercase for fuzzy matching"""
     return re.sub(r"[^a-zA-Z0-9]", "", s.lower())
 
-def find_rune_by_name(rune_name):
-    """Find rune ID by fuzzy matching the name"""
-    if not runes_data:
-        return None
-    
-    normalized_search = normalize_string(rune_name)
-    
-    # Search through all rune trees
-    for tree in runes_data:
-        # Check all slots in the tree
+def keys_with_prefix(sorted_keys, prefix):
+    """The keys of a sorted key list that start with prefix, in order"""
+    # Keys sharing the prefix are contiguous in the sorted key list
+    start = bisect.bisect_left(sorted_keys, prefix)
+    end = start
+    while end < len(sorted_keys) and sorted_keys[end].startswith(prefix):
+        end += 1
+    return sorted_keys[start:end]
+
+def build_champion_index(champion_list):
+    """Map the normalized display name, internal ID and numeric key of every champion to its ID"""
+    index = {}
+    for champion in champion_list:
+        for alias in (champion['name'], champion['alias'], str(champion['id'])):
+            champion_ids = index.setdefault(normalize_string(alias), [])
+            if champion['id'] not in champion_ids:
+                champion_ids.append(champion['id'])
+    return index
+
+def set_champions(champion_list, index=None):
+    """Install a champion list with its lookup index (built here unless cached for this version)"""
+    global champions, champion_index, champion_index_keys, champion_names
+    champions = champion_list
+    champion_index = index if index is not None else build_champion_index(champion_list)
+    champion_index_keys = sorted(champion_index)
+    champion_names = {champion['id']: champion['name'] for champion in champion_list}
+
+def find_champions(champion_name):
+    """Champion IDs matching a name, internal ID or numeric key: the exact normalized match, else every prefix match"""
+    normalized_search = normalize_string(str(champion_name))
+    if not normalized_search:
+        return []
+    exact = champion_index.get(normalized_search)
+    if exact:
+        return exact
+    matches = []
+    for key in keys_with_prefix(champion_index_keys, normalized_search):
+        matches.extend(champion_id for champion_id in champion_index[key] if champion_id not in matches)
+    return matches
+
+def resolve_champion(champion_name, where, problems):
+    """Champion ID for a config entry, or None with the reason added to problems"""
+    matches = find_champions(champion_name)
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        names = ', '.join(sorted(champion_names.get(champion_id, str(champion_id)) for champion_id in matches))
+        problems.append(f"Ambiguous champion in {where}: {champion_name} could be {names}")
+    else:
+        problems.append(f"Unknown champion in {where}: {champion_name}")
+    return None
+
+def build_rune_index():
+    """Build the normalized rune name index from runes_data and STAT_RUNES"""
+    global rune_index, rune_index_keys
+    index = {}
+    # A tree rune and a stat rune sharing a normalized name stay separate
+    # matches, so looking that name up is reported as ambiguous
+    for tree in runes_data or []:
         for slot in tree['slots']:
             for rune in slot['runes']:
-                if normalized_search in normalize_string(rune['name']):
-                    return {'id': rune['id'], 'tree_id': tree['id'], 'name': rune['name']}
-    
-    # Check stat runes
+                index.setdefault(normalize_string(rune['name']), []).append(
+                    {'id': rune['id'], 'tree_id': tree['id'], 'name': rune['name']})
     for stat_name, stat_id in STAT_RUNES.items():
-        if normalized_search in normalize_string(stat_name):
-            return {'id': stat_id, 'tree_id': None, 'name': stat_name}
-    
+        index.setdefault(normalize_string(stat_name), []).append(
+            {'id': stat_id, 'tree_id': None, 'name': stat_name})
+    rune_index = index
+    rune_index_keys = sorted(index)
+
+def _unique_rune(rune_name, matches):
+    """Return the single rune among matches, or None (with a warning) if they disagree"""
+    rune_ids = {match['id'] for match in matches}
+    if len(rune_ids) > 1:
+        names = ', '.join(sorted({match['name'] for match in matches}))
+        log.warning("Rune name '%s' is ambiguous: %s", rune_name, names)
+        return None
+    return matches[0]
+
+def find_rune_by_name(rune_name):
+    """Find rune by name: exact normalized match, then unique prefix, then unique substring"""
+    normalized_search = normalize_string(rune_name)
+    if not rune_index or not normalized_search:
+        return None
+
+    exact = rune_index.get(normalized_search)
+    if exact:
+        return _unique_rune(rune_name, exact)
+
+    prefixed = [match for key in keys_with_prefix(rune_index_keys, normalized_search) for match in rune_index[key]]
+    if prefixed:
+        return _unique_rune(rune_name, prefixed)
+
+    contained = [match for key in rune_index_keys if normalized_search in key for match in rune_index[key]]
+    if contained:
+        return _unique_rune(rune_name, contained)
+
     return None
 
-def build_rune_page(rune_names):
-    """Build a rune page from list of rune names using fuzzy matching"""
+# Rune pages with this name belong to the bot; pages with any other name are never touched
+RUNE_PAGE_NAME = 'AutoPick Runes'
+# Rune pages the bot may keep for itself unless config.json sets rune_pages.pool_size
+RUNE_PAGE_POOL_SIZE = 2
+CURRENT_RUNE_PAGE_ENDPOINT = '/lol-perks/v1/currentpage'
+
+def build_rune_page(rune_names, problems):
+    """Build a rune page from list of rune names using fuzzy matching, appending lookup problems to problems"""
+    report = problems.append
     if not rune_names or len(rune_names) == 0:
         return None
     
@@ -197,7 +582,7 @@ def build_rune_page(rune_names):
     for i, rune_name in enumerate(rune_names):
         rune_info = find_rune_by_name(rune_name)
         if not rune_info:
-            print(f"Could not find rune: {rune_name}")
+            report(f"Could not find rune: {rune_name}")
             continue
             
         selected_runes.append(rune_info['id'])
@@ -209,12 +594,12 @@ def build_rune_page(rune_names):
             secondary_tree = rune_info['tree_id']
     
     if not primary_tree:
-        print("Could not determine primary rune tree")
+        report("Could not determine primary rune tree")
         return None
     
     # Build the rune page data structure
     rune_page = {
-        'name': 'AutoPick Runes',
+        'name': RUNE_PAGE_NAME,
         'primaryStyleId': primary_tree,
         'subStyleId': secondary_tree or 8000,  # Default to Precision if no secondary
         'selectedPerkIds': selected_runes,
@@ -223,8 +608,195 @@ def build_rune_page(rune_names):
     
     return rune_page
 
-def get_role_champions(assigned_position):
-    """Get champion list for assigned role with fallback to other roles"""
+class CompiledConfig:
+    """config.json resolved to champion IDs, spell selections and rune page payloads"""
+
+    def __init__(self, raw_config):
+        self.raw = raw_config
+        # (champion ID, name) in ban order
+        self.bans = []
+        # role -> [(champion ID, compiled pick)] in pick order
+        self.roles = {}
+        self.rune_page_count = 0
+        # Rune pages the bot may keep for itself
+        self.rune_page_pool_size = RUNE_PAGE_POOL_SIZE
+        # MatchupScorer re-ranking pick candidates during the draft (None = config order)
+        self.scorer = None
+        self.problems = []
+
+def spell_selection(spell_ids):
+    """Build the my-selection payload for up to two summoner spell IDs"""
+    if len(spell_ids) == 1:
+        # Only one spell specified, set it as spell1, keep spell2 unchanged
+        return {"spell1Id": spell_ids[0]}
+    if len(spell_ids) >= 2:
+        # Two spells specified
+        return {"spell1Id": spell_ids[0], "spell2Id": spell_ids[1]}
+    return None
+
+# How config_value names the expected JSON types in problems
+CONFIG_TYPE_NAMES = {dict: "an object", list: "a list", str: "a string", (int, float): "a number"}
+
+def config_value(section, key, expected_type, default, where, problems):
+    """section[key] if it has the expected JSON type, else default with the problem added to problems"""
+    value = section.get(key)
+    if value is None:
+        return default
+    if isinstance(value, expected_type) and not isinstance(value, bool):
+        return value
+    problems.append(f"{where} must be {CONFIG_TYPE_NAMES[expected_type]}, not {value!r}")
+    return default
+
+def is_champion_name(value):
+    """Whether a config value can name a champion: a name, internal ID or numeric key"""
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+def check_pick_entry(pick_entry, where, problems):
+    """The pick entry with malformed spells and runes dropped and reported; None if it can't be used"""
+    if is_champion_name(pick_entry):
+        return str(pick_entry)
+    if not isinstance(pick_entry, dict):
+        problems.append(f"Pick entry in {where} must be a champion name or an object, not {pick_entry!r}")
+        return None
+    champion = pick_entry.get('champion')
+    if not is_champion_name(champion):
+        problems.append(f"Pick entry in {where} needs a champion name, not {champion!r}")
+        return None
+    checked = {'champion': str(champion)}
+    for field in ('spells', 'runes'):
+        values = config_value(pick_entry, field, list, [], f"{field} for {champion} ({where})", problems)
+        checked[field] = []
+        for value in values:
+            if isinstance(value, str):
+                checked[field].append(value)
+            else:
+                problems.append(f"Ignoring {value!r} in {field} for {champion} ({where}): not a name")
+    return checked
+
+def compile_pick(pick_entry, role, rune_pages, problems):
+    """Resolve one pick entry; returns None if it is malformed or its champion is unknown"""
+    pick_entry = check_pick_entry(pick_entry, role, problems)
+    if pick_entry is None:
+        return None
+    pick = parse_pick_entry(pick_entry)
+    champion_id = resolve_champion(pick['champion'], role, problems)
+    if not champion_id:
+        return None
+    pick['champion_id'] = champion_id
+
+    spell_ids = []
+    for spell in pick['spells']:
+        spell_id = SUMMONER_SPELLS.get(spell)
+        if spell_id:
+            spell_ids.append(spell_id)
+        else:
+            problems.append(f"Unknown summoner spell for {pick['champion']} ({role}): {spell}")
+    pick['spell_selection'] = spell_selection(spell_ids)
+
+    # Identical rune lists share one payload
+    rune_key = tuple(pick['runes'])
+    if rune_key and rune_key not in rune_pages:
+        rune_problems = []
+        rune_pages[rune_key] = build_rune_page(pick['runes'], rune_problems)
+        problems.extend(f"Runes for {pick['champion']} ({role}): {problem}" for problem in rune_problems)
+    pick['rune_page'] = rune_pages.get(rune_key)
+    return pick
+
+def compile_config(raw_config):
+    """Validate every config entry against the loaded static data and resolve it ahead of champ select"""
+    compiled = CompiledConfig(raw_config)
+    problems = compiled.problems
+    for ban_name in config_value(raw_config, "bans", list, [], "bans", problems):
+        if not is_champion_name(ban_name):
+            problems.append(f"Ban entries must be champion names, not {ban_name!r}")
+            continue
+        champion_id = resolve_champion(ban_name, "bans", problems)
+        if champion_id:
+            compiled.bans.append((champion_id, ban_name))
+
+    rune_pages = {}
+    for role, role_config in config_value(raw_config, "champions", dict, {}, "champions", problems).items():
+        if not isinstance(role_config, dict):
+            problems.append(f"champions.{role} must be an object, not {role_config!r}")
+            continue
+        candidates = []
+        for pick_entry in config_value(role_config, "order", list, [], f"champions.{role}.order", problems):
+            pick = compile_pick(pick_entry, role, rune_pages, compiled.problems)
+            if pick:
+                candidates.append((pick['champion_id'], pick))
+        compiled.roles[role] = candidates
+    compiled.rune_page_count = sum(1 for page in rune_pages.values() if page)
+
+    rune_pages_config = config_value(raw_config, "rune_pages", dict, {}, "rune_pages", problems)
+    pool_size = rune_pages_config.get("pool_size", RUNE_PAGE_POOL_SIZE)
+    if isinstance(pool_size, int) and not isinstance(pool_size, bool) and pool_size >= 1:
+        compiled.rune_page_pool_size = pool_size
+    else:
+        compiled.problems.append(f"rune_pages.pool_size must be a positive integer, not {pool_size!r}")
+
+    scoring_config = config_value(raw_config, "scoring", dict, {}, "scoring", problems)
+    if config_value(scoring_config, "matrix", str, "", "scoring.matrix", problems):
+        if not import_numpy():
+            compiled.problems.append("scoring.matrix is set but numpy is not installed; using config order")
+        else:
+            synergy_weight = config_value(scoring_config, "synergy_weight", (int, float), 1.0,
+                                          "scoring.synergy_weight", problems)
+            try:
+                compiled.scorer = MatchupScorer(scoring_config["matrix"], synergy_weight)
+            except Exception as e:
+                # Missing, truncated (EOFError) or malformed files alike
+                compiled.problems.append(f"Could not load scoring.matrix: {type(e).__name__}: {e}")
+
+    pick_count = sum(len(candidates) for candidates in compiled.roles.values())
+    log.info("Compiled config: %d bans, %d picks, %d/%d rune pages",
+             len(compiled.bans), pick_count, compiled.rune_page_count, len(rune_pages))
+    for problem in compiled.problems:
+        log.warning("Config problem: %s", problem)
+    return compiled
+
+def activate_config(compiled):
+    """Make a compiled config the one new champ selects use (a single reference swap)"""
+    global active_config
+    active_config = compiled
+
+async def watch_config():
+    """Recompile config.json whenever it changes on disk, without touching static data"""
+    global _config_mtime
+    while True:
+        await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+        try:
+            mtime = os.stat(CONFIG_FILE).st_mtime_ns
+        except OSError:
+            continue
+        if mtime == _config_mtime:
+            continue
+        _config_mtime = mtime
+        try:
+            raw_config = read_config()
+            log_config_summary(raw_config)
+            compiled = compile_config(raw_config)
+        except Exception as e:
+            # Keep the previous compiled config
+            log.warning("Ignoring changed config.json: %s", e, exc_info=True)
+            continue
+        activate_config(compiled)
+        log.info("config.json changed, the new config is used from the next champ select")
+
+_config_watch_task = None
+
+def start_config_watcher():
+    """Start watching config.json once per process"""
+    global _config_watch_task
+    if _config_watch_task is None:
+        _config_watch_task = asyncio.create_task(watch_config())
+
+def build_static_indexes():
+    """Rebuild lookup indexes and recompile the config after static data changes"""
+    build_rune_index()
+    activate_config(compile_config(active_config.raw if active_config else config))
+
+def get_role_candidates(compiled, assigned_position):
+    """Get (champion ID, pick entry) candidates for assigned role with fallback to other roles"""
     role_mapping = {
         'TOP': 'top',
         'JUNGLE': 'jungle', 
@@ -233,164 +805,980 @@ def get_role_champions(assigned_position):
         'UTILITY': 'utility'
     }
     
-    role_key = role_mapping.get(assigned_position, 'mid')
+    role_key = role_mapping.get(assigned_position.upper(), 'mid')
     role_order = ['top', 'jungle', 'mid', 'bot', 'utility']
     
     # Try assigned role first, then fallback to other roles
+    roles = compiled.roles if compiled else {}
     for role in [role_key] + [r for r in role_order if r != role_key]:
-        if role in champions_config and 'order' in champions_config[role]:
-            champions = champions_config[role]['order']
-            if champions:
-                return champions
+        if roles.get(role):
+            return roles[role]
     
     return []
 
+# numpy is only needed for draft-aware pick scoring; importing it is slow, so
+# that happens when a config sets scoring.matrix
+numpy = None
+
+def import_numpy():
+    """Import numpy on first use; returns False when it isn't installed"""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+    return True
+
+class MatchupScorer:
+    """Re-ranks pick candidates against the enemy and ally picks using a local matchup matrix.
+
+    The matrix is a .npy file of shape (2, N, N) indexed by champion ID, loaded
+    memory-mapped: [0][a][b] scores champion a against enemy b, [1][a][b] scores
+    a alongside ally b. Higher is better.
+    """
+
+    def __init__(self, path, synergy_weight=1.0):
+        matrix = numpy.load(path, mmap_mode='r')
+        if matrix.ndim != 3 or matrix.shape[0] != 2 or matrix.shape[1] != matrix.shape[2]:
+            raise ValueError(f"{path} has shape {matrix.shape}, expected (2, N, N)")
+        self.matchups = matrix[0]
+        self.synergies = matrix[1]
+        self.size = matrix.shape[1]
+        self.synergy_weight = synergy_weight
+        # id(candidate list) -> (candidate list, champion ID array, in-matrix mask)
+        self.candidate_ids = {}
+
+    def ids_for(self, candidates):
+        """Champion ID array for a candidate list, built once per compiled list"""
+        cached = self.candidate_ids.get(id(candidates))
+        if cached is None or cached[0] is not candidates:
+            ids = numpy.array([candidate[0] for candidate in candidates], dtype=numpy.intp)
+            in_matrix = ids < self.size
+            cached = self.candidate_ids[id(candidates)] = (candidates, numpy.where(in_matrix, ids, 0), in_matrix)
+        return cached[1], cached[2]
+
+    def score(self, table, ids, others):
+        """Sum of table[candidate][other] over the picked champions, per candidate"""
+        others = [champion_id for champion_id in others if champion_id < self.size]
+        if not others:
+            return 0
+        return table[numpy.ix_(ids, others)].sum(axis=1, dtype=numpy.float32)
+
+    def rank(self, candidates, enemy_ids, ally_ids):
+        """Candidates best first for the current draft, ties in config order; champions outside the
+        matrix have no score and follow the scored ones in config order
+        """
+        if len(candidates) < 2 or not (enemy_ids or ally_ids):
+            return candidates
+        start = time.perf_counter()
+        ids, in_matrix = self.ids_for(candidates)
+        scores = (self.score(self.matchups, ids, enemy_ids)
+                  + self.synergy_weight * self.score(self.synergies, ids, ally_ids))
+        # lexsort is stable; its last key sorts first
+        order = numpy.lexsort((-numpy.where(in_matrix, scores, 0), ~in_matrix))
+        ranked = [candidates[index] for index in order]
+        observe('pick_scoring_seconds', time.perf_counter() - start)
+        return ranked
+
+class Histogram:
+    """Latency histogram (seconds) with fixed, Prometheus-style cumulative buckets"""
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        # One extra slot for values above the last bucket (+Inf)
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def cumulative_counts(self):
+        """Return (upper bound, count of values <= bound) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.BUCKETS + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+# (metric name, sorted label pairs) -> Histogram
+metrics = {}
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+def observe(name, seconds, **labels):
+    """Record a latency sample in the named histogram"""
+    key = (name, tuple(sorted(labels.items())))
+    histogram = metrics.get(key)
+    if histogram is None:
+        histogram = metrics[key] = Histogram()
+    histogram.observe(seconds)
+
+def endpoint_template(endpoint):
+    """Replace numeric path segments so e.g. every action ID shares one series"""
+    return _ID_SEGMENT.sub('/{id}', endpoint)
+
+async def send_lcu_request(connection, method, endpoint, **kwargs):
+    """connection.request, with its latency recorded per method and endpoint"""
+    start = time.perf_counter()
+    try:
+        response = await connection.request(method, endpoint, **kwargs)
+    finally:
+        observe('lcu_request_seconds', time.perf_counter() - start,
+                method=method.upper(), endpoint=endpoint_template(endpoint))
+    log.debug("%s %s -> %s", method.upper(), endpoint, getattr(response, 'status', None))
+    if recorder is not None:
+        await recorder.record_response(method, endpoint, kwargs.get('data'), response)
+    return response
+
+# Request priorities, most urgent first: locking in a ban or pick and accepting
+# the queue, reading client state, then cosmetics (hovers, spells, runes)
+PRIORITY_ACTION = 0
+PRIORITY_STATE = 1
+PRIORITY_COSMETIC = 2
+# LCU requests in flight per client at once
+MAX_CONCURRENT_REQUESTS = 4
+# Pauses before each retry of a request that failed transiently
+RETRY_DELAYS = (0.05, 0.2, 0.5)
+# Statuses worth retrying; anything else (e.g. the LCU refusing an
+# unavailable champion) goes straight back to the caller
+TRANSIENT_STATUSES = frozenset((408, 429, 502, 503, 504))
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+def is_transient(response):
+    """Whether a failed response is worth retrying later rather than a final answer"""
+    return getattr(response, 'status', 200) in TRANSIENT_STATUSES
+
+# A failed ban or pick PATCH is either the LCU refusing that champion or the
+# action itself not accepting one (not ours, not in progress, gone); the
+# error body's errorCode and message tell them apart
+ACTION_ERROR_STATUSES = frozenset((403, 404))
+ACTION_ERROR_MARKERS = ('not in progress', 'invalid_state', 'invalid state', 'not found', 'completed')
+CHAMPION_ERROR_MARKERS = ('champion', 'banned', 'picked', 'owned', 'unavailable')
+
+async def classify_action_failure(response):
+    """'transient', 'champion' when the LCU rejected the champion, or 'action' when the action can't take any"""
+    if is_transient(response):
+        return 'transient'
+    if response.status in ACTION_ERROR_STATUSES:
+        return 'action'
+    try:
+        body = await read_json(response)
+    except (aiohttp.ClientError, ValueError):
+        body = None
+    if isinstance(body, dict):
+        message = f"{body.get('errorCode', '')} {body.get('message', '')}".lower()
+        if (not any(marker in message for marker in ACTION_ERROR_MARKERS)
+                and any(marker in message for marker in CHAMPION_ERROR_MARKERS)):
+            return 'champion'
+    # Unknown errors stop the attempt without blaming the champion
+    return 'action'
+
+class QueuedRequest:
+    """An LCU request waiting for a slot; a request superseding it replaces its kwargs before it is sent"""
+
+    def __init__(self, method, endpoint, priority, kwargs):
+        self.method = method
+        self.endpoint = endpoint
+        self.priority = priority
+        self.kwargs = kwargs
+        self.task = None
+
+class RequestScheduler:
+    """Sends one client's LCU requests by priority, a few at a time, retrying transient failures"""
+
+    def __init__(self):
+        self.active = 0
+        # (priority, sequence, future) for each request waiting for a slot
+        self.waiting = []
+        self.sequence = itertools.count()
+        # (method, endpoint) -> collapsible request not sent yet
+        self.collapsible = {}
+
+    async def acquire(self, priority):
+        if self.active < MAX_CONCURRENT_REQUESTS and not self.waiting:
+            self.active += 1
+            return
+        slot = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.sequence), slot))
+        try:
+            await slot
+        except asyncio.CancelledError:
+            # Cancelled right after release() handed us the slot; pass it on
+            if slot.done() and not slot.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiting:
+            _, _, slot = heapq.heappop(self.waiting)
+            if not slot.done():
+                # Hand the slot straight to the most urgent waiter
+                slot.set_result(None)
+                return
+        self.active -= 1
+
+    async def request(self, connection, method, endpoint, priority, collapse, kwargs):
+        """Send a request; with collapse, a queued request to the same endpoint is superseded instead"""
+        if not collapse:
+            return await self.send(connection, QueuedRequest(method, endpoint, priority, kwargs))
+        key = (method.lower(), endpoint)
+        queued = self.collapsible.get(key)
+        if queued is not None:
+            # Only the newest data is sent; both callers get its response
+            queued.kwargs = kwargs
+        else:
+            queued = self.collapsible[key] = QueuedRequest(method, endpoint, priority, kwargs)
+            queued.task = asyncio.ensure_future(self.send(connection, queued, key))
+        return await asyncio.shield(queued.task)
+
+    async def send(self, connection, queued, key=None):
+        queued_at = time.perf_counter()
+        await self.acquire(queued.priority)
+        observe('lcu_queue_seconds', time.perf_counter() - queued_at, priority=queued.priority)
+        for delay in RETRY_DELAYS + (None,):
+            if key is not None and self.collapsible.get(key) is queued:
+                # Sent from here on; newer requests queue on their own
+                del self.collapsible[key]
+            try:
+                response = await send_lcu_request(connection, queued.method, queued.endpoint, **queued.kwargs)
+                if delay is None or not is_transient(response):
+                    return response
+            except TRANSIENT_ERRORS:
+                if delay is None:
+                    raise
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+            await self.acquire(queued.priority)
+
+async def lcu_request(connection, method, endpoint, priority=PRIORITY_STATE, collapse=False, **kwargs):
+    """Send an LCU request through the client's scheduler.
+
+    Transient failures are retried with backoff; the response returned may
+    still be an error the caller has to handle.
+    """
+    return await client_state(connection).scheduler.request(connection, method, endpoint, priority, collapse, kwargs)
+
+def timed_handler(handler):
+    """Record the execution time of a websocket handler"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            observe('handler_seconds', time.perf_counter() - start, handler=handler.__name__)
+    return wrapper
+
+def render_metrics_prometheus():
+    """Render all histograms in the Prometheus text exposition format"""
+    lines = [f'lol_static_data_info{{version="{_ddragon_version or ""}"}} 1']
+    typed = set()
+    for (name, labels), histogram in sorted(metrics.items()):
+        metric = f'lol_{name}'
+        if metric not in typed:
+            lines.append(f'# TYPE {metric} histogram')
+            typed.add(metric)
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+        prefix = label_text + ',' if label_text else ''
+        for bound, count in histogram.cumulative_counts():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{metric}_bucket{{{prefix}le="{le}"}} {count}')
+        lines.append(f'{metric}_sum{{{label_text}}} {histogram.sum}')
+        lines.append(f'{metric}_count{{{label_text}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+def render_metrics_json():
+    """Render all histograms as a JSON document"""
+    exported = {}
+    for (name, labels), histogram in sorted(metrics.items()):
+        exported.setdefault(name, []).append({
+            'labels': dict(labels),
+            'count': histogram.count,
+            'sum': histogram.sum,
+            'max': histogram.max,
+            'buckets': [['+Inf' if bound == float('inf') else bound, count]
+                        for bound, count in histogram.cumulative_counts()]
+        })
+    return json.dumps({'timestamp': time.time(), 'version': _ddragon_version, 'metrics': exported}, indent=2)
+
+def write_metrics_file(text):
+    temp_file = f"{METRICS_FILE}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as f:
+        f.write(text)
+    os.replace(temp_file, METRICS_FILE)
+
+async def export_metrics():
+    """Write the metrics file; JSON if it ends in .json, Prometheus text otherwise"""
+    if not METRICS_FILE:
+        return
+    text = render_metrics_json() if METRICS_FILE.endswith('.json') else render_metrics_prometheus()
+    try:
+        await asyncio.to_thread(write_metrics_file, text)
+    except OSError as e:
+        log.warning("Failed to export metrics: %s", e)
+
+async def export_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+        await export_metrics()
+
+_metrics_task = None
+
+def start_metrics_export():
+    """Start the periodic metrics export once per process"""
+    global _metrics_task
+    if METRICS_FILE and _metrics_task is None:
+        _metrics_task = asyncio.create_task(export_metrics_periodically())
+
+class Recorder:
+    """Append websocket events and LCU responses to a JSONL file for replay.py"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+        self.start = time.perf_counter()
+
+    def write(self, kind, **fields):
+        fields['kind'] = kind
+        fields['t'] = round(time.perf_counter() - self.start, 6)
+        self.file.write(json.dumps(fields) + '\n')
+        self.file.flush()
+
+    def record_event(self, event):
+        self.write('event', uri=event.uri, type=event.type, data=event.data)
+
+    async def record_response(self, method, endpoint, data, response):
+        body = None
+        if hasattr(response, 'json'):
+            try:
+                body = await response.json(content_type=None)
+            except Exception:
+                body = None
+        self.write('response', method=method.upper(), endpoint=endpoint, data=data,
+                   status=getattr(response, 'status', None), body=body)
+
+# Set by start_recording; None means recording is off
+recorder = None
+
+async def record_event(connection, event):
+    recorder.record_event(event)
+
+def start_recording(path):
+    """Record every handled websocket event and every LCU response to path"""
+    global recorder
+    recorder = Recorder(path)
+    for registered in list(connector.ws.registered_uris):
+        connector.ws.register(registered['uri'], event_types=registered['event_types'])(record_event)
+    log.info("Recording events and LCU responses to %s", path)
+
+class Profiler:
+    """Profiling mode: startup phase timings, cProfile around the champ select handler
+    and LCU requests, and tracemalloc allocation sites, dumped to a report file.
+
+    The CPU profiler runs while any profiled call is in progress; as the event loop
+    interleaves tasks, that includes whatever else runs during those calls.
+    Websocket frames are JSON-decoded inside lcu_driver before a handler runs, so
+    that decode is timed (and CPU profiled) on its own.
+    """
+
+    def __init__(self, modes, path):
+        self.path = path
+        self.phases = [("imports", _imports_done - _import_started), ("config", _config_loaded - _imports_done)]
+        self.cpu = None
+        # Profiled calls in progress
+        self.active = 0
+        # Websocket frame decode times, and the largest frame seen (characters)
+        self.decodes = Histogram()
+        self.largest_frame = 0
+        self.memory = 'memory' in modes
+        # The profiling modules are only imported here, so they cost nothing when profiling is off
+        if 'cpu' in modes:
+            import cProfile
+            self.cpu = cProfile.Profile()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start(10)
+
+    def enter(self):
+        self.active += 1
+        if self.active == 1:
+            self.cpu.enable()
+
+    def exit(self):
+        self.active -= 1
+        if self.active == 0:
+            self.cpu.disable()
+
+    def wrap(self, coroutine_function):
+        """Profile a coroutine function's calls with the CPU profiler"""
+        @functools.wraps(coroutine_function)
+        async def profiled(*args, **kwargs):
+            self.enter()
+            try:
+                return await coroutine_function(*args, **kwargs)
+            finally:
+                self.exit()
+        return profiled
+
+    def wrap_decode(self, loads):
+        """Time (and, in cpu mode, profile) lcu_driver's JSON decode of each websocket frame"""
+        @functools.wraps(loads)
+        def timed_loads(text, *args, **kwargs):
+            start = time.perf_counter()
+            if self.cpu:
+                self.enter()
+            try:
+                return loads(text, *args, **kwargs)
+            finally:
+                if self.cpu:
+                    self.exit()
+                self.decodes.observe(time.perf_counter() - start)
+                self.largest_frame = max(self.largest_frame, len(text))
+        return timed_loads
+
+    def report(self):
+        lines = ["Startup phases (seconds):"]
+        lines.extend(f"  {name:<50} {seconds:9.4f}" for name, seconds in self.phases)
+        decodes = self.decodes
+        lines += ["", f"Websocket frame JSON decoding: {decodes.count} frames, {decodes.sum:.4f} s total, "
+                      f"{decodes.max * 1000:.3f} ms max, largest frame {self.largest_frame / 1024:.0f} KiB"]
+        if self.cpu:
+            import pstats
+            stream = io.StringIO()
+            try:
+                # Collecting the stats stops the profiler
+                stats = pstats.Stats(self.cpu, stream=stream)
+            except TypeError:
+                # Raised when nothing has been profiled yet
+                stats = None
+            if self.active:
+                self.cpu.enable()
+            if stats is not None:
+                stats.sort_stats('cumulative').print_stats(40)
+            else:
+                stream.write("  No profiled calls yet\n")
+            lines += ["", "CPU profile of champ_select_changed, LCU requests and websocket frame decoding:",
+                      stream.getvalue()]
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            lines += ["", f"Memory: {current / 1024:.0f} KiB traced, {peak / 1024:.0f} KiB peak; top allocation sites:"]
+            lines.extend(f"  {stat}" for stat in tracemalloc.take_snapshot().statistics('lineno')[:25])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        """Write the report file"""
+        try:
+            report = self.report()
+            with open(self.path, 'w') as f:
+                f.write(report)
+            log.info("Wrote profile to %s", self.path)
+        except Exception as e:
+            log.warning("Failed to write profile: %s", e)
+
+# Set by start_profiling; None means profiling is off and nothing is measured
+profiler = None
+
+def record_phase(name, started):
+    """Record how long a startup phase took, when profiling"""
+    if profiler is not None:
+        profiler.phases.append((name, time.perf_counter() - started))
+
+async def timed_phase(name, awaitable):
+    """Await a startup phase, recording its duration when profiling"""
+    if profiler is None:
+        return await awaitable
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        record_phase(name, started)
+
+def start_profiling(modes, path):
+    """Turn on profiling; dumps the report on SIGUSR1 (SIGBREAK on Windows) and at exit"""
+    global profiler, send_lcu_request
+    profiler = Profiler(modes, path)
+    # lcu_driver decodes each websocket frame with its own json.loads import
+    lcu_connection.loads = profiler.wrap_decode(lcu_connection.loads)
+    if profiler.cpu:
+        # Swapped in only now, so without profiling the handlers run unwrapped
+        send_lcu_request = profiler.wrap(send_lcu_request)
+        for registered in connector.ws.registered_uris:
+            if registered['coroutine_or_callable'] is champ_select_changed:
+                registered['coroutine_or_callable'] = profiler.wrap(champ_select_changed)
+    dump_signal = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK', None)
+    if dump_signal is not None:
+        signal.signal(dump_signal, lambda signum, frame: profiler.dump())
+    atexit.register(profiler.dump)
+    log.info("Profiling (%s), report in %s", ', '.join(sorted(modes)), path)
+
+def parse_profile_modes(value):
+    """Profiling modes from a comma list of timings, cpu and memory; None if any is unknown"""
+    modes = {mode.strip().lower() for mode in value.split(',') if mode.strip()}
+    # LOL_PROFILE=1 and the like mean the default mode
+    if modes & {'1', 'true', 'yes', 'on'}:
+        modes = (modes - {'1', 'true', 'yes', 'on'}) | {'cpu'}
+    modes.add('timings')
+    return modes if modes <= {'timings', 'cpu', 'memory'} else None
+
+class ClientState:
+    """State of one connected League client; static data and config are shared by all clients"""
+
+    def __init__(self):
+        self.champ_select = ChampSelectSession()
+        self.have_i_prepicked = False
+        self.in_game = False
+        # Last phase seen by the gameflow watcher (None until known)
+        self.gameflow_phase = None
+        # Client's rune page list, kept current by /lol-perks/v1/pages events (None = unknown)
+        self.rune_pages = None
+        self.rune_page_pool = RunePagePool()
+        self.scheduler = RequestScheduler()
+
+# Connection -> ClientState for every client this process serves
+clients = {}
+
+def client_state(connection):
+    """Get the state of the client behind a connection, creating it on first use"""
+    client = clients.get(connection)
+    if client is None:
+        client = clients[connection] = ClientState()
+    return client
+
+# Static data load shared by clients connecting at the same time
+_static_data_task = None
+
+async def load_static_data_once():
+    """Load static data on the first connect, joining a load already in flight.
+
+    Later connects reuse the installed data at once and only ask the patch
+    checker to look for a new version in the background.
+    """
+    global _static_data_task
+    if static_data is not None:
+        static_data_check_requested.set()
+        return
+    if _static_data_task is None or _static_data_task.done():
+        _static_data_task = asyncio.create_task(load_static_data())
+    await asyncio.shield(_static_data_task)
+
 @connector.ready
 async def connect(connection):
-    global champions_map, runes_data
-    champions_map = await get_champions_map()
-    runes_data = await get_runes_data()
-    await load_stat_runes()
+    client_state(connection)
+    start_metrics_export()
+    start_config_watcher()
+    start_static_data_watcher()
+    await timed_phase("connect", asyncio.gather(
+        timed_phase("connect: static data", load_static_data_once()),
+        timed_phase("connect: rune pages", seed_rune_pages(connection)),
+        timed_phase("connect: gameflow phase", seed_gameflow_phase(connection))))
 
 @connector.ws.register('/lol-matchmaking/v1/ready-check', event_types=('UPDATE',))
+@timed_handler
 async def ready_check_changed(connection, event):
-    global have_i_prepicked
     if event.data['state'] == 'InProgress' and event.data['playerResponse'] == 'None':
-        await connection.request('post', '/lol-matchmaking/v1/ready-check/accept', data={})
-        # Reset prepick status when accepting a new queue
-        have_i_prepicked = False
-        print("Queue accepted, reset prepick status")
+        received_at = time.perf_counter()
+        await lcu_request(connection, 'post', '/lol-matchmaking/v1/ready-check/accept', PRIORITY_ACTION, data={})
+        observe('ready_check_accept_seconds', time.perf_counter() - received_at)
+        log.info("Queue accepted")
 
+def set_gameflow_phase(client, new_phase):
+    """Track the gameflow phase and do the per-game state resets on its transitions"""
+    if new_phase == client.gameflow_phase:
+        return
+    previous_phase, client.gameflow_phase = client.gameflow_phase, new_phase
 
-@connector.ws.register('/lol-champ-select/v1/session', event_types=('CREATE', 'UPDATE',))
-async def champ_select_changed(connection, event):
-    global am_i_assigned, pick_number, ban_number, am_i_banning, am_i_picking, phase, bans, in_game, action_id, have_i_prepicked, assigned_position
-    
-    lobby_phase = event.data['timer']['phase']
-
-    local_player_cell_id = event.data['localPlayerCellId']
-    for teammate in event.data['myTeam']:
-        if teammate['cellId'] == local_player_cell_id:
-            assigned_position = teammate['assignedPosition']
-            am_i_assigned = True
-
-    print(f'Assigned position: {assigned_position}')
-
-    # Get list of banned champions
-    banned_champions = []
-    for action_list in event.data['actions']:
-        for action in action_list:
-            if action['type'] == 'ban' and action['completed']:
-                banned_champions.append(action['championId'])
-
-    for action in event.data['actions']:
-        for actionArr in action:
-            if actionArr['actorCellId'] == local_player_cell_id and actionArr['isInProgress'] == True:
-                phase = actionArr['type']
-                action_id = actionArr['id']
-                if phase == 'ban':
-                    am_i_banning = actionArr['isInProgress']
-                if phase == 'pick':
-                    am_i_picking = actionArr['isInProgress']
-
-    if phase == 'ban' and lobby_phase == 'BAN_PICK' and am_i_banning:
-        while am_i_banning and ban_number < len(bans):
-            try:
-                await connection.request('patch', '/lol-champ-select/v1/session/actions/%d' % action_id,
-                                         data={"championId": champions_map[bans[ban_number]], "completed": True})
-                print(f"Successfully banned {bans[ban_number]}")
-                break
-            except Exception as e:
-                print(f"Failed to ban {bans[ban_number]}: {str(e)}")
-                print(f"Full error: {traceback.format_exc()}")
-                ban_number += 1
-                if ban_number >= len(bans):
-                    pick_number = 0
-        ban_number = 0  # Reset ban number after successful ban
-        am_i_banning = False
-
-    if phase == 'pick' and lobby_phase == 'BAN_PICK' and am_i_picking:
-        role_champions = get_role_champions(assigned_position)
-        while am_i_picking and pick_number < len(role_champions):
-            try:
-                pick_data = parse_pick_entry(role_champions[pick_number])
-                champion_id = champions_map.get(pick_data['champion'])
-                
-                if not champion_id:
-                    print(f"Champion {pick_data['champion']} not found, trying next pick")
-                    pick_number += 1
-                    continue
-                    
-                if champion_id in banned_champions:
-                    print(f"{pick_data['champion']} is banned, trying next pick")
-                    pick_number += 1
-                    continue
-                
-                await connection.request('patch', '/lol-champ-select/v1/session/actions/%d' % action_id,
-                                         data={"championId": champion_id, "completed": True})
-                print(f"Successfully picked {pick_data['champion']} for {assigned_position}")
-                
-                # Set summoner spells if specified
-                if pick_data['spells']:
-                    await set_summoner_spells(connection, pick_data['spells'])
-                
-                # Set runes if specified
-                if pick_data['runes']:
-                    await set_runes(connection, pick_data['runes'])
-                
+    # A new queue pop, or leaving champ select (dodge or game start), ends the
+    # previous champ select; its session can't be reused
+    if new_phase == 'ReadyCheck' or previous_phase == 'ChampSelect':
+        client.have_i_prepicked = False
+        client.champ_select.reset()
+
+    if new_phase == 'InProgress' and not client.in_game:
+        log.info("Game started! Continuing to monitor for next champion select...")
+    client.in_game = new_phase == 'InProgress'
+
+async def seed_gameflow_phase(connection):
+    """Load the current gameflow phase once per connection; events keep it current afterwards"""
+    try:
+        phase = await read_json(await lcu_request(connection, 'get', '/lol-gameflow/v1/gameflow-phase'))
+        set_gameflow_phase(client_state(connection), phase)
+    except Exception as e:
+        log.warning("Failed to load gameflow phase: %s", e)
+
+@connector.ws.register('/lol-gameflow/v1/gameflow-phase', event_types=('CREATE', 'UPDATE',))
+async def gameflow_phase_changed(connection, event):
+    set_gameflow_phase(client_state(connection), event.data)
+
+
+# Pick candidates kept ready to send ahead of our pick turn
+PREPARED_PICK_COUNT = 3
+# Pauses before a failed ban, pick or prepick is tried again, the last one repeating
+CHAMP_SELECT_RETRY_DELAYS = (0.25, 0.5, 1, 2)
+
+class PreparedPick:
+    """Ready-to-send requests for locking in (or hovering) one pick candidate"""
+
+    def __init__(self, champion_id, pick, action_id, rune_page_pool, pool_size):
+        self.champion_id = champion_id
+        self.pick = pick
+        self.endpoint = f'/lol-champ-select/v1/session/actions/{action_id}'
+        self.lock_in = {"championId": champion_id, "completed": True}
+        self.hover = {"championId": champion_id, "completed": False}
+        self.rune_plan = rune_page_pool.plan(pick['rune_page'], pool_size) if pick['rune_page'] else None
+
+class ChampSelectSession:
+    """Last processed champ select snapshot, diffed against each new session event"""
+
+    def __init__(self):
+        # Newest event data not processed yet (received since pending_since),
+        # and whether a pass is running
+        self.pending = None
+        self.pending_since = None
+        self.busy = False
+        self.retry_task = None
+        self.reset()
+
+    def reset(self):
+        """Forget everything about the previous champ select"""
+        # Config edits take effect from the next champ select, never mid-lobby
+        self.config = active_config
+        self.game_id = None
+        self.lobby_phase = None
+        self.local_cell_id = None
+        self.assigned_position = ''
+        self.my_action_id = None
+        self.my_action_type = None
+        self.my_action_started_at = None
+        self.acted_action_id = None
+        # Backoff after a failed ban, pick or prepick: failures so far, when
+        # the next attempt is due and the task waking the lobby up for it
+        self.failures = 0
+        self.retry_at = 0
+        self.cancel_retry()
+        self.last_data = None
+        # Our (not yet completed) pick action, the requests prepared for it
+        # (None when they need rebuilding) and the champion whose spells and
+        # runes are currently set
+        self.pick_action_id = None
+        self.prepared = None
+        self.setup_champion_id = None
+        self.completed_action_ids = set()
+        # Champions that can't be banned or picked: bans, completed picks and
+        # champions the LCU rejected (locked), plus other players' hovers
+        self.locked_champions = set()
+        self.hovers = {}
+        # Champions the LCU refused to ban; they stay available for picks
+        self.rejected_bans = set()
+        self.unavailable = set()
+        # Champions locked in by the other players, for draft-aware scoring
+        self.ally_picks = []
+        self.enemy_picks = []
+
+    def cancel_retry(self):
+        """Drop the scheduled retry pass, unless it is the pass running now"""
+        if self.retry_task is not None and self.retry_task is not asyncio.current_task():
+            self.retry_task.cancel()
+        self.retry_task = None
+
+    def update(self, data):
+        """Apply a session snapshot and return what changed since the last one"""
+        if data.get('gameId') != self.game_id:
+            self.reset()
+            self.game_id = data.get('gameId')
+
+        changes = {
+            'position_changed': False,
+            'action_started': False,
+            'new_bans': [],
+            'new_picks': []
+        }
+
+        self.lobby_phase = data['timer']['phase']
+
+        self.local_cell_id = data['localPlayerCellId']
+        for teammate in data['myTeam']:
+            if teammate['cellId'] == self.local_cell_id:
+                if teammate['assignedPosition'] != self.assigned_position:
+                    self.assigned_position = teammate['assignedPosition']
+                    changes['position_changed'] = True
+                    self.prepared = None
                 break
-            except Exception as e:
-                print(f"Failed to pick {role_champions[pick_number]}: {str(e)}")
-                print(f"Full error: {traceback.format_exc()}")
-                pick_number += 1
-                if pick_number >= len(role_champions):
-                    pick_number = 0
-        pick_number = 0
-        am_i_picking = False
-
-    if lobby_phase == 'PLANNING' and not have_i_prepicked:
-        # Find the pick action for pre-picking
+
+        my_action_id = None
+        my_action_type = None
         pick_action_id = None
-        for action_list in event.data['actions']:
+        for action_list in data['actions']:
             for action in action_list:
-                if action['actorCellId'] == local_player_cell_id and action['type'] == 'pick':
-                    pick_action_id = action['id']
-                    break
-        
-        if pick_action_id:
-            try:
-                role_champions = get_role_champions(assigned_position)
-                pick_data = parse_pick_entry(role_champions[0]) if role_champions else None
-                if pick_data:
-                    champion_id = champions_map.get(pick_data['champion'])
-                    if champion_id:
-                        await connection.request('patch', f'/lol-champ-select/v1/session/actions/{pick_action_id}',
-                                                 data={"championId": champion_id, "completed": False})
-                        print(f"Pre-picked {pick_data['champion']} for {assigned_position}")
-                        have_i_prepicked = True
-                        
-                        # Set summoner spells if specified
-                        if pick_data['spells']:
-                            await set_summoner_spells(connection, pick_data['spells'])
-                            
-                        # Set runes if specified
-                        if pick_data['runes']:
-                            await set_runes(connection, pick_data['runes'])
-            except Exception as e:
-                print(f"Failed to pre-pick: {str(e)}")
-                print(f"Full error: {traceback.format_exc()}")
+                if action['actorCellId'] == self.local_cell_id:
+                    if action['isInProgress']:
+                        my_action_id = action['id']
+                        my_action_type = action['type']
+                    if action['type'] == 'pick' and not action['completed'] and pick_action_id is None:
+                        pick_action_id = action['id']
+                if action['completed'] and action['id'] not in self.completed_action_ids:
+                    self.completed_action_ids.add(action['id'])
+                    if action['type'] == 'ban':
+                        changes['new_bans'].append(action['championId'])
+                    elif action['type'] == 'pick':
+                        changes['new_picks'].append(action['championId'])
+                        if action['championId'] and action['actorCellId'] != self.local_cell_id:
+                            if any(player['cellId'] == action['actorCellId'] for player in data['myTeam']):
+                                self.ally_picks.append(action['championId'])
+                            else:
+                                self.enemy_picks.append(action['championId'])
+                    self.mark_locked(action['championId'])
+
+        # Other players' hovers and intents; these come and go, so they are
+        # tracked per cell and only rebuilt into the set when one changes
+        hovers = {}
+        for player in data['myTeam'] + data.get('theirTeam', []):
+            if player['cellId'] != self.local_cell_id:
+                champion_id = player.get('championId') or player.get('championPickIntent')
+                if champion_id:
+                    hovers[player['cellId']] = champion_id
+        if hovers != self.hovers:
+            self.hovers = hovers
+            self.unavailable = self.locked_champions | set(hovers.values())
+            self.prepared = None
+            # A champion nobody hovers any more may be worth trying again
+            if self.retry_at == float('inf'):
+                self.retry_at = 0
+
+        if pick_action_id != self.pick_action_id:
+            self.pick_action_id = pick_action_id
+            self.prepared = None
+
+        if my_action_id != self.my_action_id:
+            changes['action_started'] = my_action_id is not None
+            self.failures = 0
+            self.retry_at = 0
+        self.my_action_id = my_action_id
+        self.my_action_type = my_action_type
+        return changes
+
+    def mark_locked(self, champion_id):
+        """Record a champion as permanently unavailable for this champ select"""
+        if champion_id:
+            self.locked_champions.add(champion_id)
+            self.unavailable.add(champion_id)
+            self.prepared = None
+
+    def first_available(self, candidates):
+        """Return the first (champion ID, ...) candidate nobody has banned, picked or hovered"""
+        unavailable = self.unavailable
+        return next((candidate for candidate in candidates if candidate[0] not in unavailable), None)
+
+    def prepared_picks(self, rune_page_pool):
+        """Requests for the top available candidates for our pick, rebuilt only after something changed"""
+        if self.prepared is None:
+            self.prepared = []
+            if self.pick_action_id is not None:
+                unavailable = self.unavailable
+                pool_size = self.config.rune_page_pool_size if self.config else RUNE_PAGE_POOL_SIZE
+                candidates = get_role_candidates(self.config, self.assigned_position)
+                if self.config and self.config.scorer:
+                    candidates = self.config.scorer.rank(candidates, self.enemy_picks, self.ally_picks)
+                for champion_id, pick in candidates:
+                    if champion_id not in unavailable:
+                        self.prepared.append(PreparedPick(champion_id, pick, self.pick_action_id,
+                                                          rune_page_pool, pool_size))
+                        if len(self.prepared) == PREPARED_PICK_COUNT:
+                            break
+        return self.prepared
+
+@connector.ws.register('/lol-champ-select/v1/session', event_types=('CREATE', 'UPDATE',))
+@timed_handler
+async def champ_select_changed(connection, event):
+    received_at = time.perf_counter()
+    # Don't act on a half-loaded champion map
+    await static_data_ready.wait()
+    await submit_champ_select(connection, client_state(connection).champ_select, event.data, received_at)
+
+async def submit_champ_select(connection, champ_select, data, received_at):
+    """Process a session snapshot, or queue it behind the pass already running"""
+    # Coalesce bursts: while a pass is running (e.g. waiting on a PATCH), only
+    # the newest snapshot is kept and processed once that pass finishes
+    if champ_select.pending is None:
+        champ_select.pending_since = received_at
+    champ_select.pending = data
+    if champ_select.busy:
+        return
+    champ_select.busy = True
+    try:
+        while champ_select.pending is not None:
+            data, champ_select.pending = champ_select.pending, None
+            await process_champ_select(connection, champ_select, data, champ_select.pending_since)
+    finally:
+        champ_select.busy = False
+
+async def process_champ_select(connection, champ_select, data, received_at):
+    """Run ban/pick/prepick logic for the parts of the session that changed"""
+    changes = champ_select.update(data)
+    champ_select.last_data = data
+    log.debug("Champ select pass: phase %s, our action %s (%s), %d unavailable, changes %s",
+              champ_select.lobby_phase, champ_select.my_action_id, champ_select.my_action_type,
+              len(champ_select.unavailable), changes)
+    if changes['action_started']:
+        # Earliest receipt among the coalesced events that started our action
+        champ_select.my_action_started_at = received_at
+    lobby_phase = champ_select.lobby_phase
+    assigned_position = champ_select.assigned_position
+
+    if changes['position_changed']:
+        log.info("Assigned position: %s", assigned_position)
+
+    # Act when our action starts; retry a failed one on any later pass once
+    # its backoff is up, or straight away when bans/picks moved
+    action_id = champ_select.my_action_id
+    retry_due = time.perf_counter() >= champ_select.retry_at
+    if (lobby_phase == 'BAN_PICK' and action_id is not None and action_id != champ_select.acted_action_id
+            and (changes['action_started'] or changes['new_bans'] or changes['new_picks'] or retry_due)):
+        if champ_select.my_action_type == 'ban':
+            done = await ban_champion(connection, champ_select, action_id)
+        elif champ_select.my_action_type == 'pick':
+            done = await pick_champion(connection, champ_select, assigned_position)
+        else:
+            done = None
+        if done:
+            champ_select.acted_action_id = action_id
+        elif done is False:
+            schedule_champ_select_retry(connection, champ_select)
+        else:
+            # Nothing left to try until bans or picks move
+            champ_select.retry_at = float('inf')
+
+    client = client_state(connection)
+    if (lobby_phase == 'PLANNING' and not client.have_i_prepicked and champ_select.pick_action_id is not None
+            and retry_due):
+        done = await prepick_champion(connection, champ_select, assigned_position)
+        if done is False:
+            schedule_champ_select_retry(connection, champ_select)
+
+    # Lookahead: while others ban and pick, rebuild our pick's requests as soon
+    # as they go stale so the pick turn itself only sends them
+    if champ_select.pick_action_id is not None:
+        champ_select.prepared_picks(client.rune_page_pool)
 
-    if lobby_phase == 'FINALIZATION':
+def schedule_champ_select_retry(connection, champ_select):
+    """Back off after a failed attempt and run another pass on the last snapshot once the delay is up"""
+    delay = CHAMP_SELECT_RETRY_DELAYS[min(champ_select.failures, len(CHAMP_SELECT_RETRY_DELAYS) - 1)]
+    champ_select.failures += 1
+    champ_select.retry_at = time.perf_counter() + delay
+    champ_select.cancel_retry()
+    game_id = champ_select.game_id
+
+    async def retry():
+        await asyncio.sleep(delay)
+        # A pass already running or queued picks the retry up itself, and a
+        # new champ select drops it
+        if (champ_select.game_id == game_id and champ_select.last_data is not None
+                and not champ_select.busy and champ_select.pending is None):
+            await submit_champ_select(connection, champ_select, champ_select.last_data, time.perf_counter())
+
+    champ_select.retry_task = asyncio.create_task(retry())
+
+def observe_action_latency(champ_select, action_type):
+    """Record the time from our action becoming in progress to its completing PATCH"""
+    if champ_select.my_action_started_at is not None:
+        observe('action_patch_seconds', time.perf_counter() - champ_select.my_action_started_at, type=action_type)
+
+async def ban_champion(connection, champ_select, action_id):
+    """Ban the first configured champion that is still available
+
+    Returns True on success, False on a failure worth retrying and None when no configured ban is available.
+    """
+    bans = champ_select.config.bans if champ_select.config else []
+    while True:
+        candidate = champ_select.first_available(ban for ban in bans if ban[0] not in champ_select.rejected_bans)
+        if not candidate:
+            log.warning("No configured ban is available")
+            return None
+        champion_id, ban_name = candidate
         try:
-            game_state = await connection.request('get', '/lol-gameflow/v1/gameflow-phase')
-            if game_state == 'InGame' and not in_game:
-                print("Game started! Continuing to monitor for next champion select...")
-                in_game = True
-            await asyncio.sleep(2)
+            response = await lcu_request(connection, 'patch', '/lol-champ-select/v1/session/actions/%d' % action_id,
+                                         PRIORITY_ACTION, data={"championId": champion_id, "completed": True})
+            if getattr(response, 'status', 200) < 400:
+                observe_action_latency(champ_select, 'ban')
+                log.info("Successfully banned %s", ban_name,
+                         extra={'fields': {'event': 'ban', 'champion_id': champion_id, 'action_id': action_id}})
+                return True
+            log.warning("Failed to ban %s: HTTP %s", ban_name, response.status)
+            if await classify_action_failure(response) != 'champion':
+                return False
         except Exception as e:
-            print('Waiting for game to start...')
-            print(f"Error checking game state: {str(e)}")
-            await asyncio.sleep(2)
+            # Retries are exhausted; a later pass tries again after a backoff
+            log.error("Failed to ban %s: %s", ban_name, e, exc_info=True)
+            return False
+        # The LCU won't ban this champion; try the next ban without ruling it out as a pick
+        champ_select.rejected_bans.add(champion_id)
+
+async def pick_champion(connection, champ_select, assigned_position):
+    """Lock in the first available champion for our role from the prepared picks
+
+    Returns True on success, False on a failure worth retrying and None when no configured champion is available.
+    """
+    client = client_state(connection)
+    while True:
+        prepared = champ_select.prepared_picks(client.rune_page_pool)
+        if not prepared:
+            log.warning("No configured champion is available for %s", assigned_position)
+            return None
+        candidate = prepared[0]
+        pick_data = candidate.pick
+        try:
+            response = await lcu_request(connection, 'patch', candidate.endpoint, PRIORITY_ACTION,
+                                         data=candidate.lock_in)
+            if getattr(response, 'status', 200) < 400:
+                observe_action_latency(champ_select, 'pick')
+                log.info("Successfully picked %s for %s", pick_data['champion'], assigned_position,
+                         extra={'fields': {'event': 'pick', 'champion_id': candidate.champion_id,
+                                           'position': assigned_position}})
+                await set_pick_setup(connection, champ_select, candidate)
+                return True
+            log.warning("Failed to pick %s: HTTP %s", pick_data['champion'], response.status)
+            if await classify_action_failure(response) != 'champion':
+                return False
+        except Exception as e:
+            # Retries are exhausted; a later pass tries again after a backoff
+            log.error("Failed to pick %s: %s", pick_data['champion'], e, exc_info=True)
+            return False
+        # The LCU refused the champion; this also drops the prepared requests,
+        # so the next pass rebuilds them without it
+        champ_select.mark_locked(candidate.champion_id)
+
+async def prepick_champion(connection, champ_select, assigned_position):
+    """Hover the first available champion for our role during the planning phase
+
+    Returns True on success, False on a failure worth retrying and None when no champion is available.
+    """
+    client = client_state(connection)
+    try:
+        prepared = champ_select.prepared_picks(client.rune_page_pool)
+        if not prepared:
+            return None
+        candidate = prepared[0]
+        response = await lcu_request(connection, 'patch', candidate.endpoint, PRIORITY_COSMETIC, collapse=True,
+                                     data=candidate.hover)
+        if getattr(response, 'status', 200) >= 400:
+            log.warning("Failed to pre-pick %s: HTTP %s", candidate.pick['champion'], response.status)
+            return False
+        log.info("Pre-picked %s for %s", candidate.pick['champion'], assigned_position)
+        client.have_i_prepicked = True
+
+        await set_pick_setup(connection, champ_select, candidate)
+        return True
+    except Exception as e:
+        log.error("Failed to pre-pick: %s", e, exc_info=True)
+        return False
 
 
 def parse_pick_entry(pick_entry):
@@ -407,86 +1795,297 @@ def parse_pick_entry(pick_entry):
     else:
         return {'champion': '', 'spells': [], 'runes': []}
 
-async def set_summoner_spells(connection, spells):
-    """Set summoner spells using the my-selection endpoint"""
-    if not spells or len(spells) == 0:
+async def set_pick_setup(connection, champ_select, prepared):
+    """Set the summoner spells and runes of a prepared pick concurrently, unless already set by the prepick"""
+    if prepared.champion_id == champ_select.setup_champion_id:
         return
-    
+    champ_select.setup_champion_id = prepared.champion_id
+    pick = prepared.pick
+    setup = []
+    if pick['spell_selection']:
+        setup.append(set_summoner_spells(connection, pick))
+    if pick['rune_page']:
+        setup.append(set_runes(connection, pick['rune_page'], prepared.rune_plan))
+    if setup:
+        await asyncio.gather(*setup)
+
+async def set_summoner_spells(connection, pick):
+    """Set the pick's compiled summoner spells using the my-selection endpoint"""
     try:
-        spell_ids = []
-        for spell in spells:
-            spell_id = SUMMONER_SPELLS.get(spell.lower())
-            if spell_id:
-                spell_ids.append(spell_id)
-            else:
-                print(f"Unknown summoner spell: {spell}")
-        
-        if len(spell_ids) == 1:
-            # Only one spell specified, set it as spell1, keep spell2 unchanged
-            data = {"spell1Id": spell_ids[0]}
-        elif len(spell_ids) >= 2:
-            # Two spells specified
-            data = {"spell1Id": spell_ids[0], "spell2Id": spell_ids[1]}
-        else:
-            return
-        
-        await connection.request('patch', '/lol-champ-select/v1/session/my-selection', data=data)
-        spell_names = [spell for spell in spells if spell.lower() in SUMMONER_SPELLS]
-        print(f"Set summoner spells: {', '.join(spell_names)}")
+        await lcu_request(connection, 'patch', '/lol-champ-select/v1/session/my-selection', PRIORITY_COSMETIC,
+                          collapse=True, data=pick['spell_selection'])
+        log.info("Set summoner spells: %s", ', '.join(spell for spell in pick['spells'] if spell in SUMMONER_SPELLS))
         
     except Exception as e:
-        print(f"Failed to set summoner spells {spells}: {str(e)}")
-        print(f"Full error: {traceback.format_exc()}")
+        log.error("Failed to set summoner spells %s: %s", pick['spells'], e, exc_info=True)
 
-async def set_runes(connection, rune_names):
-    """Set runes by creating/replacing a rune page"""
-    if not rune_names or len(rune_names) == 0:
-        return
-    
+async def read_json(response):
+    """Return the decoded JSON body of an LCU response"""
+    if hasattr(response, 'json'):
+        return await response.json()
+    return response
+
+def rune_setup_key(rune_page):
+    """The trees and perks of a rune page, which identify the setup it holds"""
+    return (rune_page.get('primaryStyleId'), rune_page.get('subStyleId'),
+            tuple(rune_page.get('selectedPerkIds', ())))
+
+class RunePagePool:
+    """The bot's own rune pages and the rune setup each one holds, least recently used first"""
+
+    def __init__(self):
+        # page ID -> rune setup key, least recently used first
+        self.pages = OrderedDict()
+        self.current_page_id = None
+        # Pages counting against the account's page slots, and how many slots it owns (None = unknown)
+        self.editable_page_count = 0
+        self.owned_page_count = None
+
+    def sync(self, rune_pages):
+        """Adopt the bot's pages from the client's page list, keeping the known usage order"""
+        found = {}
+        self.current_page_id = None
+        self.editable_page_count = 0
+        for page in rune_pages:
+            if page.get('current'):
+                self.current_page_id = page['id']
+            if page.get('isDeletable', True):
+                self.editable_page_count += 1
+            if page.get('name') == RUNE_PAGE_NAME and page.get('isEditable', True):
+                found[page['id']] = rune_setup_key(page)
+        # Pages not used since startup count as the least recently used
+        pages = OrderedDict((page_id, key) for page_id, key in found.items() if page_id not in self.pages)
+        pages.update((page_id, found[page_id]) for page_id in self.pages if page_id in found)
+        self.pages = pages
+
+    def plan(self, rune_page_data, pool_size):
+        """(method, endpoint, data, page ID) switching to a rune setup, or None if the bot has no page to use.
+
+        Switching to a stored setup only changes the current page; method is None
+        when that page is already current. A new setup goes on a new page while
+        the pool and the account have room, otherwise over the least recently used one.
+        """
+        key = rune_setup_key(rune_page_data)
+        for page_id, page_key in self.pages.items():
+            if page_key == key:
+                if page_id == self.current_page_id:
+                    return None, None, None, page_id
+                return 'put', CURRENT_RUNE_PAGE_ENDPOINT, page_id, page_id
+        has_free_slot = self.owned_page_count is None or self.editable_page_count < self.owned_page_count
+        if len(self.pages) < pool_size and has_free_slot:
+            return 'post', '/lol-perks/v1/pages', rune_page_data, None
+        if self.pages:
+            page_id = next(iter(self.pages))
+            return 'put', f'/lol-perks/v1/pages/{page_id}', dict(rune_page_data, id=page_id), page_id
+        return None
+
+    def store(self, page_id, rune_page_data):
+        """Record a page as holding a setup, current and most recently used"""
+        if page_id not in self.pages:
+            self.editable_page_count += 1
+        self.pages.pop(page_id, None)
+        self.pages[page_id] = rune_setup_key(rune_page_data)
+        self.current_page_id = page_id
+
+async def refresh_rune_pages(connection):
+    """Fetch the client's rune pages into the cached page list and the bot's page pool"""
+    client = client_state(connection)
+    client.rune_pages = await read_json(await lcu_request(connection, 'get', '/lol-perks/v1/pages'))
+    client.rune_page_pool.sync(client.rune_pages)
+    return client.rune_pages
+
+async def read_rune_page_inventory(connection):
+    """Read how many rune pages the account owns, which limits how far the pool can grow"""
+    inventory = await read_json(await lcu_request(connection, 'get', '/lol-perks/v1/inventory'))
+    client_state(connection).rune_page_pool.owned_page_count = inventory.get('ownedPageCount')
+
+async def seed_rune_pages(connection):
+    """Load the rune page list once per connection; events keep it current afterwards"""
     try:
-        # Build rune page from names
-        rune_page_data = build_rune_page(rune_names)
-        if not rune_page_data:
-            print("Failed to build rune page")
-            return
-        
-        # Get current rune pages to find one to replace
-        pages_response = await connection.request('get', '/lol-perks/v1/pages')
-        if hasattr(pages_response, 'json'):
-            current_pages = await pages_response.json()
-        else:
-            current_pages = pages_response
-        
-        # Delete the oldest editable page if we have too many, or find an AutoPick page to replace
-        page_to_replace = None
-        for page in current_pages:
-            if not page.get('isDeletable', True):
-                continue
-            if page.get('name') == 'AutoPick Runes':
-                page_to_replace = page
-                break
-        
-        # If no AutoPick page found, replace oldest editable page
-        if not page_to_replace:
-            editable_pages = [p for p in current_pages if p.get('isDeletable', True)]
-            if editable_pages:
-                page_to_replace = editable_pages[0]  # Replace first editable page
-        
-        # Delete the page to replace
-        if page_to_replace:
-            await connection.request('delete', f'/lol-perks/v1/pages/{page_to_replace["id"]}')
-        
-        # Create new rune page
-        await connection.request('post', '/lol-perks/v1/pages', data=rune_page_data)
-        print(f"Set runes: {rune_page_data['name']}")
+        await asyncio.gather(refresh_rune_pages(connection), read_rune_page_inventory(connection))
+    except Exception as e:
+        log.warning("Failed to load rune pages: %s", e)
+
+@connector.ws.register('/lol-perks/v1/pages', event_types=('CREATE', 'UPDATE', 'DELETE',))
+async def rune_pages_changed(connection, event):
+    client = client_state(connection)
+    client.rune_pages = event.data if event.type != 'DELETE' and isinstance(event.data, list) else None
+    if client.rune_pages is not None:
+        client.rune_page_pool.sync(client.rune_pages)
+    # Prepared rune plans were made against the old page list
+    client.champ_select.prepared = None
+
+async def set_runes(connection, rune_page_data, plan=None):
+    """Switch to a rune setup using only the bot's own rune pages; plan is a RunePagePool.plan made ahead of time"""
+    client = client_state(connection)
+    pool = client.rune_page_pool
+    config = client.champ_select.config
+    pool_size = config.rune_page_pool_size if config else RUNE_PAGE_POOL_SIZE
+    try:
+        if plan is None:
+            if client.rune_pages is None:
+                await refresh_rune_pages(connection)
+            plan = pool.plan(rune_page_data, pool_size)
+        for attempt in range(2):
+            if plan is None:
+                log.warning("No rune page left for the bot: free a rune page slot or raise rune_pages.pool_size")
+                return
+            method, endpoint, data, page_id = plan
+            if method is None:
+                log.info("Set runes: %s", rune_page_data['name'])
+                return
+            response = await lcu_request(connection, method, endpoint, PRIORITY_COSMETIC,
+                                         collapse=method == 'put', data=data)
+            if getattr(response, 'status', 200) < 400:
+                if page_id is None:
+                    page_id = (await read_json(response))['id']
+                pool.store(page_id, rune_page_data)
+                client.champ_select.prepared = None
+                log.info("Set runes: %s", rune_page_data['name'])
+                return
+            # The page list was stale (e.g. the user deleted one of our pages); resync and plan again
+            await refresh_rune_pages(connection)
+            plan = pool.plan(rune_page_data, pool_size)
+        log.warning("Failed to set runes: HTTP %s", response.status)
         
     except Exception as e:
-        print(f"Failed to set runes: {str(e)}")
-        print(f"Full error: {traceback.format_exc()}")
+        log.error("Failed to set runes: %s", e, exc_info=True)
 
 @connector.close
-async def disconnect(_):
-    print('The client has been closed!')
+async def disconnect(connection):
+    log.info("The client has been closed!")
+    clients.pop(connection, None)
+    await export_metrics()
+    if not clients:
+        await close_http_session()
+
+class MultiClientConnector(MultipleClientConnector):
+    """Serves every League client found on this machine, or one shard of them.
 
+    Replaces MultipleClientConnector's discovery loop, which can start two
+    connections for one client and fails to unregister closed ones.
+    """
+    # Seconds between scans for newly started clients
+    DISCOVERY_INTERVAL = 2
+
+    def __init__(self, shard_index=0, shard_count=1):
+        super().__init__()
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        # App PIDs of clients with a running connection
+        self.serving = set()
+        # Handlers were registered on the module-level connector by the decorators above
+        self.ws = connector.ws
+        self._handlers = connector.handlers
+
+    def register_connection(self, connection):
+        self.connections.append(connection)
+
+    def unregister_connection(self, lcu_pid):
+        self.connections = [connection for connection in self.connections if connection._lcu_pid != lcu_pid]
+
+    async def serve(self, connection):
+        try:
+            await connection.init()
+        finally:
+            self.serving.discard(connection.pid)
 
-connector.start()
\ No newline at end of file
+    @staticmethod
+    def find_client_processes():
+        """League client processes running now; a process exiting mid-scan skips this scan"""
+        try:
+            return list(_return_ux_process())
+        except psutil.Error:
+            return []
+
+    async def _astart(self):
+        tasks = []
+        try:
+            while True:
+                for process in self.find_client_processes():
+                    try:
+                        connection = Connection(self, process)
+                    except (psutil.Error, KeyError, ValueError):
+                        # Client still starting up (or gone); try again next scan
+                        continue
+                    if connection.pid in self.serving or connection.pid % self.shard_count != self.shard_index:
+                        continue
+                    self.serving.add(connection.pid)
+                    log.info("Serving League client %d on port %d", connection.pid, connection.port)
+                    tasks.append(asyncio.create_task(self.serve(connection)))
+                await asyncio.sleep(self.DISCOVERY_INTERVAL)
+        finally:
+            await asyncio.gather(*tasks)
+
+def env_flag(name):
+    """Whether an environment variable is set to a true value such as 1, true, yes or on"""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def shard_path(path, shard_index):
+    """A worker's own copy of an output file: the shard index goes before the extension"""
+    base, extension = os.path.splitext(path)
+    return f"{base}.{shard_index}{extension}"
+
+def run_shard(shard_index, shard_count, record=None, log_level=None, profile_modes=None, profile_file=None):
+    """Worker process entry point: serve the clients whose app PID falls in this shard"""
+    global METRICS_FILE
+    listener = start_logging(log_level, shard_path(LOG_FILE, shard_index) if LOG_FILE else None)
+    if METRICS_FILE:
+        METRICS_FILE = shard_path(METRICS_FILE, shard_index)
+    if record:
+        start_recording(f"{record}.{shard_index}")
+    if profile_modes:
+        start_profiling(profile_modes, shard_path(profile_file, shard_index))
+    try:
+        MultiClientConnector(shard_index, shard_count).start()
+    finally:
+        # Forked workers exit without running atexit handlers while spawned
+        # ones (the Windows default) run them; flush here, exactly once
+        if profiler is not None:
+            atexit.unregister(profiler.dump)
+            profiler.dump()
+        atexit.unregister(listener.stop)
+        listener.stop()
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='League of Legends champ select bot')
+    parser.add_argument('--record', metavar='FILE', default=os.environ.get('LOL_RECORD'),
+                        help='record websocket events and LCU responses to a JSONL file (see replay.py)')
+    parser.add_argument('--multi', action='store_true', default=env_flag('LOL_MULTI'),
+                        help='serve every running League client instead of the first one found')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('LOL_WORKERS', 1)),
+                        help='with --multi, split the clients across this many worker processes')
+    parser.add_argument('--log-level', default=os.environ.get('LOL_LOG_LEVEL'),
+                        help='DEBUG, INFO, WARNING or ERROR (default: logging.level in config.json, else INFO)')
+    parser.add_argument('--profile', nargs='?', const='cpu', default=os.environ.get('LOL_PROFILE'), metavar='MODES',
+                        help='profile startup phases plus cpu and/or memory, comma separated (default: cpu); '
+                             'send SIGUSR1 (Ctrl+Break on Windows) to write the report')
+    parser.add_argument('--profile-file', default=os.environ.get('LOL_PROFILE_FILE', 'profile.txt'),
+                        help='where the profiling report is written')
+    args = parser.parse_args()
+    profile_modes = parse_profile_modes(args.profile) if args.profile else None
+    if args.profile and profile_modes is None:
+        parser.error(f"unknown profiling mode in {args.profile!r}: use timings, cpu and/or memory")
+    if args.multi and args.workers > 1:
+        # Workers log to their own files; this process only reports startup
+        start_logging(args.log_level, None)
+        log_config_summary(config)
+        workers = [multiprocessing.Process(target=run_shard, args=(index, args.workers, args.record, args.log_level,
+                                                                   profile_modes, args.profile_file))
+                   for index in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        start_logging(args.log_level)
+        log_config_summary(config)
+        if args.record:
+            start_recording(args.record)
+        if profile_modes:
+            start_profiling(profile_modes, args.profile_file)
+        if args.multi:
+            MultiClientConnector().start()
+        else:
+            connector.start()
\ No newline at end of file
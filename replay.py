@@ -0,0 +1,247 @@
+"""Replay recorded champ select traffic through the bot's handlers without a League client.
+
+Record a session with `python main.py --record session.jsonl`, then run
+`python replay.py session.jsonl` (add `--speed 10` to replay ten times faster,
+or `--speed 0` to replay as fast as possible).
+"""
+import argparse
+import asyncio
+import copy
+import json
+import re
+import time
+from collections import defaultdict, deque
+
+import main
+
+SESSION_URI = '/lol-champ-select/v1/session'
+_ACTION_ENDPOINT = re.compile(r'^/lol-champ-select/v1/session/actions/(\d+)$')
+
+
+class FakeResponse:
+    """Stand-in for the aiohttp response returned by connection.request"""
+
+    def __init__(self, status=200, body=None):
+        self.status = status
+        self.body = body
+
+    async def json(self, content_type=None):
+        return self.body
+
+    async def text(self):
+        return json.dumps(self.body)
+
+
+class FakeEvent:
+    """Stand-in for lcu_driver's WebsocketEventResponse"""
+
+    def __init__(self, uri, event_type, data):
+        self.uri = uri
+        self.type = event_type
+        self.data = data
+
+
+class FakeConnection:
+    """Local LCU stand-in: answers from a recording first, then from a small simulated client.
+
+    Every request is logged in `calls` as (time, method, endpoint, data, status).
+    """
+
+    def __init__(self, recorded_responses=None, latency=0.0):
+        self.recorded_responses = recorded_responses or {}
+        self.latency = latency
+        self.calls = []
+        self.gameflow_phase = 'Lobby'
+        self.rune_pages = [{'id': 1, 'name': 'My Page', 'isDeletable': True, 'isEditable': True,
+                            'selectedPerkIds': [], 'current': True}]
+        self.next_page_id = 100
+        self.owned_page_count = 20
+        self.address = 'https://127.0.0.1:0'
+        self.pid = 0
+
+    async def request(self, method, endpoint, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        method = method.upper()
+        data = kwargs.get('data')
+        recorded = self.recorded_responses.get((method, endpoint))
+        if recorded:
+            status, body = recorded.popleft()
+        else:
+            status, body = self.simulate(method, endpoint, data)
+        self.calls.append((time.perf_counter(), method, endpoint, data, status))
+        return FakeResponse(status, copy.deepcopy(body))
+
+    def set_current_page(self, current):
+        for page in self.rune_pages:
+            page['current'] = page is current
+
+    def simulate(self, method, endpoint, data):
+        """Answer the endpoints the bot uses the way the client would"""
+        if endpoint == '/lol-gameflow/v1/gameflow-phase':
+            return 200, self.gameflow_phase
+        if endpoint == '/lol-perks/v1/pages':
+            if method == 'POST':
+                if len(self.rune_pages) >= self.owned_page_count:
+                    return 400, {'message': 'Max pages reached'}
+                page = dict(data, id=self.next_page_id, isDeletable=True, isEditable=True)
+                self.next_page_id += 1
+                self.rune_pages.append(page)
+                self.set_current_page(page)
+                return 200, page
+            return 200, self.rune_pages
+        if endpoint.startswith('/lol-perks/v1/pages/'):
+            page_id = int(endpoint.rsplit('/', 1)[1])
+            page = next((page for page in self.rune_pages if page['id'] == page_id), None)
+            if page is None:
+                return 404, {'message': 'page not found'}
+            if method == 'DELETE':
+                self.rune_pages.remove(page)
+            elif method == 'PUT':
+                page.update(data)
+                if data.get('current'):
+                    self.set_current_page(page)
+            return 200, page
+        if endpoint == '/lol-perks/v1/currentpage':
+            page = next((page for page in self.rune_pages if page['id'] == data), None)
+            if page is None:
+                return 404, {'message': 'page not found'}
+            self.set_current_page(page)
+            return 204, None
+        if endpoint == '/lol-perks/v1/inventory':
+            return 200, {'ownedPageCount': self.owned_page_count}
+        return 204, None
+
+
+def load_recording(path):
+    """Read a recording into (events, recorded responses)"""
+    events = []
+    responses = defaultdict(deque)
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry['kind'] == 'event':
+                events.append((entry['t'], entry['uri'], entry['type'], entry['data']))
+            elif entry['kind'] == 'response':
+                responses[(entry['method'], entry['endpoint'])].append((entry['status'], entry['body']))
+    return events, responses
+
+
+def matching_handlers(uri, event_type):
+    """Handlers registered on main.connector for an event, using lcu_driver's matching rules"""
+    handlers = []
+    for registered in main.connector.ws.registered_uris:
+        if registered['coroutine_or_callable'] is main.record_event:
+            continue
+        if registered['uri'] == uri or (registered['uri'].endswith('/') and uri.startswith(registered['uri'])):
+            if event_type.upper() in registered['event_types']:
+                handlers.append(registered['coroutine_or_callable'])
+    return handlers
+
+
+def reset_state():
+    """Put the bot back into its freshly started state"""
+    main.clients.clear()
+    main.metrics.clear()
+    # Replays must not write the live metrics file
+    main.METRICS_FILE = None
+
+
+async def prepare(connection, load_static_data=True):
+    """Run the bot's ready handler against the fake connection
+
+    With load_static_data=False the already loaded static data is reused and only
+    the per-connection state (rune pages, gameflow phase) is seeded.
+    """
+    reset_state()
+    if load_static_data:
+        await main.connect(connection)
+    else:
+        await asyncio.gather(main.seed_rune_pages(connection), main.seed_gameflow_phase(connection))
+
+
+async def replay(events, connection, speed=1.0):
+    """Feed events through the handlers like lcu_driver does, one task per matching handler.
+
+    speed is a time multiplier for the recorded timestamps; 0 replays without pauses.
+    Returns the list of (dispatch time, uri, data) for every dispatched event.
+    """
+    dispatched = []
+    tasks = []
+    start = time.perf_counter()
+    first_t = events[0][0] if events else 0
+    for t, uri, event_type, data in events:
+        if speed:
+            delay = (t - first_t) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        dispatched.append((time.perf_counter(), uri, data))
+        for handler in matching_handlers(uri, event_type):
+            tasks.append(asyncio.create_task(handler(connection, FakeEvent(uri, event_type, data))))
+        # Let handlers start between events, like frames arriving on the websocket
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return dispatched
+
+
+def action_latencies(dispatched, calls):
+    """Seconds from the event where our action went in progress to its completing PATCH"""
+    started = {}
+    for dispatched_at, uri, data in dispatched:
+        if uri != SESSION_URI or not isinstance(data, dict):
+            continue
+        for action_list in data.get('actions', []):
+            for action in action_list:
+                if (action['actorCellId'] == data.get('localPlayerCellId') and action['isInProgress']
+                        and action['id'] not in started):
+                    started[action['id']] = dispatched_at
+
+    latencies = []
+    for called_at, method, endpoint, data, status in calls:
+        match = _ACTION_ENDPOINT.match(endpoint)
+        if method == 'PATCH' and match and data and data.get('completed') and status < 400:
+            action_id = int(match.group(1))
+            if action_id in started:
+                latencies.append(called_at - started.pop(action_id))
+    return latencies
+
+
+def summarize(name, event_count, elapsed, latencies):
+    """Print throughput and latency figures for a replay run"""
+    throughput = event_count / elapsed if elapsed > 0 else float('inf')
+    print(f"{name}: {event_count} events in {elapsed * 1000:.1f} ms ({throughput:.0f} events/sec)")
+    if latencies:
+        ordered = sorted(latencies)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        print(f"  event-to-PATCH latency: p50 {p50 * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms, "
+              f"max {ordered[-1] * 1000:.2f} ms over {len(ordered)} actions")
+    else:
+        print("  no completed ban/pick PATCH")
+
+
+async def replay_file(path, speed, latency):
+    events, responses = load_recording(path)
+    connection = FakeConnection(responses, latency=latency)
+    await prepare(connection)
+    start = time.perf_counter()
+    dispatched = await replay(events, connection, speed=speed)
+    elapsed = time.perf_counter() - start
+    await main.close_http_session()
+    summarize(path, len(events), elapsed, action_latencies(dispatched, connection.calls))
+    for called_at, method, endpoint, data, status in connection.calls:
+        print(f"  {(called_at - start) * 1000:9.1f} ms  {method} {endpoint} -> {status}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the bot handlers')
+    parser.add_argument('recording', help='JSONL file written by main.py --record')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed multiplier (0 = as fast as possible)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated LCU latency per request in seconds')
+    args = parser.parse_args()
+    main.start_logging(log_file=None)
+    asyncio.run(replay_file(args.recording, args.speed, args.latency))